@@ -0,0 +1,145 @@
+import pandas as pd
+import numpy as np
+
+# Outlier rules: values outside [Q1 - k * IQR, Q3 + k * IQR] of their group,
+# or more than k standard deviations from their group mean
+OUTLIER_METHODS = ("IQR", "Z-score")
+DEFAULT_THRESHOLDS = {"IQR": 1.5, "Z-score": 3.0}
+
+# Price outliers are compared with cars of the same make, model and year
+DEFAULT_TARGET_COLUMN = "Price"
+DEFAULT_GROUP_COLUMNS = ("Make", "Model", "Year")
+
+LOG_COLUMNS = ["Step", "Column", "Count"]
+
+
+def blank_mask(series):
+    """
+    Flag text values that are empty or whitespace only.
+
+    Categorical columns are checked once per category rather than per row.
+
+    Args:
+        series (pandas.Series): The column to check
+
+    Returns:
+        numpy.ndarray: Boolean mask with one entry per row
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        categories = series.cat.categories
+        if categories.dtype != object:
+            return np.zeros(len(series), dtype=bool)
+        blank_categories = categories.astype(str).str.strip().to_numpy() == ""
+        codes = series.cat.codes.to_numpy()
+        return (codes >= 0) & blank_categories[np.maximum(codes, 0)]
+    if series.dtype == object or pd.api.types.is_string_dtype(series):
+        return series.str.strip().eq("").fillna(False).to_numpy(dtype=bool)
+    return np.zeros(len(series), dtype=bool)
+
+
+def drop_missing(data):
+    """
+    Drop every row holding a null or blank value.
+
+    Args:
+        data (pandas.DataFrame): The dataframe to clean
+
+    Returns:
+        tuple: (remaining rows, log rows) where the log counts the blank values
+            converted to nulls per column and the rows dropped
+    """
+    drop = data.isna().any(axis=1).to_numpy()
+    log = []
+    for column, series in data.items():
+        blanks = blank_mask(series)
+        if blanks.any():
+            drop |= blanks
+            log.append(("Blanks converted to nulls", str(column), int(blanks.sum())))
+    log.append(("Rows dropped with nulls or blanks", "All", int(drop.sum())))
+    return data[~drop], log
+
+
+def outlier_mask(values, groups, method="IQR", threshold=None):
+    """
+    Flag values that are outliers within their group.
+
+    Group statistics are broadcast back to the rows with groupby-transform,
+    so there is no Python loop over groups.
+
+    Args:
+        values (pandas.Series): The numeric values to check
+        groups (numpy.ndarray): Group number of each row
+        method (str): One of OUTLIER_METHODS
+        threshold (float): IQR multiplier or z-score limit; defaults per method
+
+    Returns:
+        pandas.Series: Boolean mask aligned with values
+    """
+    if threshold is None:
+        threshold = DEFAULT_THRESHOLDS[method]
+    grouped = values.groupby(groups, sort=False)
+
+    if method == "IQR":
+        q1 = grouped.transform("quantile", 0.25)
+        q3 = grouped.transform("quantile", 0.75)
+        spread = threshold * (q3 - q1)
+        return (values < q1 - spread) | (values > q3 + spread)
+    if method == "Z-score":
+        mean = grouped.transform("mean")
+        std = grouped.transform("std")
+        # Single-row and constant groups have no spread and no outliers
+        return ((values - mean).abs() > threshold * std) & (std > 0)
+    raise ValueError(f"Unknown outlier method: {method}")
+
+
+def clean_data(data, target=DEFAULT_TARGET_COLUMN, group_columns=DEFAULT_GROUP_COLUMNS,
+               method="IQR", threshold=None):
+    """
+    Drop nulls and blanks, then impute the target's outliers with their group mean.
+
+    Outliers are found within each combination of the group columns and
+    replaced by the mean of the group's remaining values, so the outliers
+    do not pull the imputed value. Nothing else is changed.
+
+    Args:
+        data (pandas.DataFrame): The loaded dataframe
+        target (str): Numeric column whose outliers are imputed
+        group_columns (tuple): Columns defining the comparison groups
+        method (str): One of OUTLIER_METHODS
+        threshold (float): IQR multiplier or z-score limit; defaults per method
+
+    Returns:
+        tuple: (cleaned DataFrame, cleaning log DataFrame with Step, Column
+            and Count columns)
+    """
+    cleaned, log = drop_missing(data)
+
+    group_columns = [column for column in group_columns if column in cleaned.columns]
+    if target not in cleaned.columns or not pd.api.types.is_numeric_dtype(cleaned[target]):
+        log.append(("Outlier imputation skipped (no numeric target column)", str(target), 0))
+    elif not len(cleaned):
+        log.append(("Outliers imputed with group mean", str(target), 0))
+    else:
+        # Group numbers are computed once and reused by every transform
+        if group_columns:
+            groups = cleaned.groupby(group_columns, observed=True, sort=False).ngroup().to_numpy()
+        else:
+            groups = np.zeros(len(cleaned), dtype=np.int64)
+
+        values = cleaned[target].astype(np.float64)
+        outliers = outlier_mask(values, groups, method, threshold)
+        count = int(outliers.sum())
+        if count:
+            means = values.where(~outliers).groupby(groups, sort=False).transform("mean")
+            imputed = values.mask(outliers, means)
+            original_dtype = cleaned[target].dtype
+            cleaned = cleaned.copy()
+            if pd.api.types.is_float_dtype(original_dtype):
+                cleaned[target] = imputed.astype(original_dtype)
+            else:
+                # Group means are fractional, so integer columns become floats
+                cleaned[target] = imputed
+                log.append(("Converted to float for imputed means", str(target), len(cleaned)))
+        log.append((f"Outliers imputed with group mean ({method})", str(target), count))
+
+    return cleaned, pd.DataFrame(log, columns=LOG_COLUMNS)
@@ -1,149 +1,2956 @@
 import pandas as pd
 import numpy as np
 import streamlit as st
+from streamlit import runtime
 import altair as alt
-from datetime import datetime
+from datetime import date, datetime, time as dt_time
+from decimal import Decimal
 import plotly.express as px
 import re
+import os
+import ast
+import operator
+import tokenize
+import io
+import json
+import hashlib
+import secrets
+import base64
+import zlib
+import functools
+import gzip
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pandas.api.types import union_categoricals
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+from cleaning import clean_data, OUTLIER_METHODS, DEFAULT_TARGET_COLUMN, DEFAULT_GROUP_COLUMNS
+
+try:
+    from pandas.tseries.api import guess_datetime_format
+except ImportError:  # pandas < 2.2
+    from pandas._libs.tslibs.parsing import guess_datetime_format
+
+# Upper bound on the memory held by parsed datasets shared across sessions
+DATASET_CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+# Columnar copies of parsed uploads, reloaded with memory mapping across sessions
+DATASET_DISK_CACHE_DIR = os.environ.get(
+    "DASHBOARD_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "analytics_dashboard")
+)
+DATASET_DISK_CACHE_MAX_BYTES = 20 * 1024 ** 3
+
+# Bumped whenever the load pipeline changes what ends up in a cached dataset
+DATASET_PIPELINE_VERSION = 4
+
+# Schema metadata key under which the memory report is stored in cache files
+MEMORY_REPORT_METADATA_KEY = b"dashboard.memory_report"
+
+# Object columns with at most this share of distinct values become categoricals
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+
+# Date detection: sample size and values used to guess a format
+DATE_SAMPLE_ROWS = 1_000
+DATE_FORMAT_GUESSES = 20
+
+# Uploads at least this large default to chunked, streaming ingestion
+STREAMING_THRESHOLD_BYTES = 256 * 1024 ** 2
+CSV_CHUNK_ROWS = 250_000
+DTYPE_SAMPLE_ROWS = 10_000
+
+# Sampling mode: datasets at least this long are explored on a sample by
+# default, of this many rows unless the user picks another size
+SAMPLE_AUTO_ROWS = 50_000_000
+SAMPLE_DEFAULT_ROWS = 1_000_000
+
+# Numeric columns with fewer distinct values than this get a multiselect
+CATEGORICAL_MAX_UNIQUE = 20
+
+# Categorical columns with more distinct values than this get a type-ahead
+# search instead of a multiselect listing every value
+HIGH_CARDINALITY_THRESHOLD = 1_000
+SEARCH_MAX_MATCHES = 50
+
+# Number of columns offered in the filter panel before the user picks any
+DEFAULT_FILTER_COLUMNS = 6
+
+# Upper bound on the memory held by cached column profiles
+PROFILE_CACHE_MAX_BYTES = 256 * 1024 ** 2
+
+# Upper bound on the memory held by cached per-column indexes, and the
+# dataset size from which filtering uses them by default
+INDEX_CACHE_MAX_BYTES = 1024 ** 3
+INDEX_MIN_ROWS = 1_000_000
+
+# Default memory budget for memoized filter results, in megabytes
+FILTER_CACHE_DEFAULT_MB = 512
+
+# Number of compiled filter expressions kept across sessions
+EXPRESSION_CACHE_SIZE = 256
+
+# Largest integer, in bits, that constant arithmetic in an expression may
+# produce, and the rows an expression is test-run on before it is accepted
+EXPRESSION_MAX_INT_BITS = 256
+EXPRESSION_TRIAL_ROWS = 100
+
+# Page sizes offered by the data explorer; only one page is ever sent to
+# the browser
+EXPLORER_PAGE_SIZES = (50, 100, 500, 1_000, 5_000)
+EXPLORER_DEFAULT_PAGE_SIZE = 100
+
+# Columns shown by the data explorer before the user picks any
+EXPLORER_DEFAULT_COLUMNS = 20
+
+# Rows gathered and written per chunk when exporting, and the export
+# formats with their file suffixes
+EXPORT_CHUNK_ROWS = 100_000
+EXPORT_FORMATS = {
+    "CSV": ".csv",
+    "CSV (gzip)": ".csv.gz",
+    "Parquet": ".parquet",
+}
+
+# Exports are written to the app's static folder and downloaded through
+# Streamlit's static file route (server.enableStaticServing), which streams
+# them from disk in chunks. The route refuses files over 200 MB. Files are
+# removed when the session's view changes, or once older than an hour.
+EXPORT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "exports")
+EXPORT_URL = "app/static/exports"
+EXPORT_MAX_BYTES = 200 * 1024 ** 2
+EXPORT_FILE_PREFIX = "dashboard-export-"
+EXPORT_STALE_SECONDS = 3600
+
+# Query parameter holding the filter spec of a shared view, and how many
+# fingerprint characters tie it to its dataset
+FILTER_QUERY_PARAM = "filters"
+FILTER_PARAM_FINGERPRINT_CHARS = 12
+
+# Extensions accepted by the uploader; the actual format is detected from the content
+UPLOAD_TYPES = ["csv", "gz", "bz2", "zst", "zip", "xz", "parquet", "pq", "feather", "arrow", "ipc"]
+
+# Leading magic bytes of the columnar formats and CSV compression codecs
+MAGIC_FORMATS = [
+    (b"PAR1", "parquet"),
+    (b"ARROW1", "feather"),
+    (b"FEA1", "feather"),
+]
+MAGIC_COMPRESSION = [
+    (b"\x1f\x8b", "gzip"),
+    (b"\x28\xb5\x2f\xfd", "zstd"),
+    (b"BZh", "bz2"),
+    (b"PK\x03\x04", "zip"),
+    (b"\xfd7zXZ\x00", "xz"),
+]
+
+# Codecs decompressed natively by Arrow; the rest are left to pandas
+ARROW_CODECS = {"gzip", "bz2", "zstd"}
+
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache bounded by an approximate byte budget.
+
+    Streamlit serves every session from the same process, so instances are
+    shared through st.cache_resource and guarded by a lock.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Return the cached value for key, or None when it is not cached.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, nbytes):
+        """
+        Store value under key, evicting the least recently used entries
+        until the cache fits in its budget. Values larger than the whole
+        budget are not cached.
+        """
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            if nbytes > self.max_bytes:
+                return
+            self._entries[key] = (value, nbytes)
+            self.current_bytes += nbytes
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_bytes) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_bytes
+
+    def resize(self, max_bytes):
+        """
+        Change the byte budget, evicting least recently used entries if needed.
+        """
+        with self._lock:
+            self.max_bytes = max_bytes
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_bytes) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_bytes
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _shared_cache(factory):
+    """
+    Share one instance of a cache per process.
+
+    Inside the Streamlit runtime the instance is held by st.cache_resource.
+    Outside it (batch jobs, tests), cache_resource builds a new instance on
+    every call, so the first instance is kept at module level instead.
+    """
+    resource = st.cache_resource(factory)
+    instances = []
+
+    @functools.wraps(factory)
+    def get():
+        if runtime.exists():
+            return resource()
+        if not instances:
+            instances.append(factory())
+        return instances[0]
+
+    return get
+
+
+@_shared_cache
+def _dataset_cache():
+    """
+    Process-wide cache of parsed datasets keyed by content fingerprint.
+    """
+    return LRUCache(DATASET_CACHE_MAX_BYTES)
+
+
+def _series_nbytes(series, sample_rows=1_000):
+    """
+    Estimate the resident size of a series, including Python string objects.
+
+    Object columns are measured on a sample and scaled up, since a deep
+    memory_usage() over millions of strings costs more than reloading them.
+    """
+    if series.dtype == object and len(series) > sample_rows:
+        sample = series.sample(sample_rows, random_state=0)
+        return int(sample.memory_usage(index=False, deep=True) / sample_rows * len(series))
+    return int(series.memory_usage(index=False, deep=True))
+
+
+def _frame_nbytes(data):
+    """
+    Estimate the resident size of a dataframe, including Python string objects.
+    """
+    return int(data.index.memory_usage() + sum(_series_nbytes(series) for _, series in data.items()))
+
+
+def _disk_cache_path(fingerprint):
+    """
+    Return the Arrow IPC file used to persist the dataset with this fingerprint.
+    """
+    name = f"{fingerprint.replace(':', '-')}.v{DATASET_PIPELINE_VERSION}.arrow"
+    return os.path.join(DATASET_DISK_CACHE_DIR, name)
+
+
+def _read_disk_cache(fingerprint):
+    """
+    Reload a previously parsed dataset from the on-disk Arrow cache.
+
+    The file is memory-mapped, so numeric columns without nulls are handed
+    to pandas without copying and nothing is parsed.
+
+    Returns:
+        tuple: (data, memory report), or None if it is not on disk
+    """
+    path = _disk_cache_path(fingerprint)
+    if not os.path.exists(path):
+        return None
+    try:
+        table = feather.read_table(path, memory_map=True)
+        metadata = table.schema.metadata or {}
+        report = None
+        if MEMORY_REPORT_METADATA_KEY in metadata:
+            report = pd.read_json(io.StringIO(metadata[MEMORY_REPORT_METADATA_KEY].decode()), orient="split")
+        data = table.to_pandas(split_blocks=True, self_destruct=True)
+    except Exception:
+        return None
+    # Refresh the modification time so pruning evicts least recently used files
+    try:
+        os.utime(path)
+    except OSError:
+        # Another session pruned it; the mapped data stays readable
+        pass
+    return data, report
+
+
+def _write_disk_cache(fingerprint, data, report=None):
+    """
+    Persist a parsed dataset as an uncompressed Arrow IPC (Feather v2) file.
+
+    Uncompressed files can be memory-mapped on reload. The memory report is
+    kept in the schema metadata. Frames that Arrow cannot represent (e.g.
+    mixed-type object columns) are simply not cached.
+    """
+    path = _disk_cache_path(fingerprint)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(DATASET_DISK_CACHE_DIR, exist_ok=True)
+        table = pa.Table.from_pandas(data, preserve_index=False)
+        if report is not None:
+            metadata = dict(table.schema.metadata or {})
+            metadata[MEMORY_REPORT_METADATA_KEY] = report.to_json(orient="split").encode()
+            table = table.replace_schema_metadata(metadata)
+        feather.write_feather(table, tmp_path, compression="uncompressed")
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return
+    _prune_disk_cache()
+
+
+def _prune_disk_cache(max_bytes=DATASET_DISK_CACHE_MAX_BYTES):
+    """
+    Delete the least recently used cache files until the directory fits in max_bytes.
+
+    Other sessions may prune the same directory concurrently, so files that
+    vanish in between are skipped.
+    """
+    entries = []
+    for name in os.listdir(DATASET_DISK_CACHE_DIR):
+        if name.endswith(".arrow"):
+            try:
+                stat = os.stat(os.path.join(DATASET_DISK_CACHE_DIR, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, name in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(os.path.join(DATASET_DISK_CACHE_DIR, name))
+        except OSError:
+            pass
+        total -= size
+
+
+def _fingerprint(uploaded_file):
+    """
+    Compute a content fingerprint for an uploaded file.
+
+    The digest is remembered per upload in the session state so reruns
+    do not rehash the bytes.
+
+    Args:
+        uploaded_file (UploadedFile): The file returned by st.file_uploader
+
+    Returns:
+        str: Hex digest of the file contents
+    """
+    fingerprints = st.session_state.setdefault("_upload_fingerprints", {})
+    fingerprint = fingerprints.get(uploaded_file.file_id)
+    if fingerprint is None:
+        digest = hashlib.blake2b(digest_size=16)
+        with uploaded_file.getbuffer() as view:
+            digest.update(view)
+        fingerprint = digest.hexdigest()
+        fingerprints[uploaded_file.file_id] = fingerprint
+    return fingerprint
+
+
+def detect_format(uploaded_file):
+    """
+    Detect the file format and compression from the leading bytes of an upload.
+
+    Args:
+        uploaded_file (UploadedFile): The file returned by st.file_uploader
+
+    Returns:
+        tuple: (format, compression) where format is "csv", "parquet" or
+            "feather" and compression is a codec name or None
+    """
+    with uploaded_file.getbuffer() as view:
+        head = bytes(view[:8])
+
+    for magic, file_format in MAGIC_FORMATS:
+        if head.startswith(magic):
+            return file_format, None
+    for magic, compression in MAGIC_COMPRESSION:
+        if head.startswith(magic):
+            return "csv", compression
+    return "csv", None
+
+
+def _csv_source(uploaded_file, compression):
+    """
+    Open an upload for CSV parsing, decompressing with Arrow where possible.
+
+    Arrow decompresses gzip, bz2 and zstd as a stream over a zero-copy view
+    of the upload, so nothing is inflated in memory ahead of the parser.
+
+    Returns:
+        tuple: (file-like source, compression argument for pd.read_csv,
+            raw reader whose tell() is the number of upload bytes consumed)
+    """
+    uploaded_file.seek(0)
+    if compression in ARROW_CODECS:
+        raw = pa.BufferReader(pa.py_buffer(uploaded_file.getbuffer()))
+        return pa.CompressedInputStream(raw, compression), None, raw
+    return uploaded_file, compression, uploaded_file
+
+
+def read_csv(uploaded_file, compression=None):
+    """
+    Parse a whole (optionally compressed) CSV upload with the multithreaded
+    Arrow engine, falling back to the C engine for files Arrow rejects.
+
+    Args:
+        uploaded_file (UploadedFile): The file returned by st.file_uploader
+        compression (str): Compression codec detected for the upload, if any
+
+    Returns:
+        pandas.DataFrame: The parsed data
+    """
+    source, pandas_compression, _ = _csv_source(uploaded_file, compression)
+    try:
+        return pd.read_csv(source, compression=pandas_compression, engine="pyarrow")
+    except (pa.ArrowInvalid, ValueError):
+        source, pandas_compression, _ = _csv_source(uploaded_file, compression)
+        return pd.read_csv(source, compression=pandas_compression)
+
+
+def read_upload(uploaded_file, streaming=False):
+    """
+    Read an upload in whichever format it was detected to be.
+
+    Args:
+        uploaded_file (UploadedFile): The file returned by st.file_uploader
+        streaming (bool): Parse CSV input in chunks with a progress bar
+
+    Returns:
+        pandas.DataFrame: The loaded data
+    """
+    file_format, compression = detect_format(uploaded_file)
+    uploaded_file.seek(0)
+
+    # Arrow date columns would otherwise arrive as objects holding datetime.date
+    if file_format == "parquet":
+        return pq.read_table(uploaded_file).to_pandas(date_as_object=False)
+    if file_format == "feather":
+        return feather.read_table(uploaded_file).to_pandas(split_blocks=True, self_destruct=True, date_as_object=False)
+    if streaming:
+        return read_csv_streaming(uploaded_file, compression)
+    return read_csv(uploaded_file, compression)
+
+
+def _downcast_series(series):
+    """
+    Downcast a numeric series to the smallest dtype that holds it exactly.
+
+    Integers shrink to the narrowest integer type; floats become float32
+    only when every value survives the round trip.
+    """
+    if pd.api.types.is_bool_dtype(series):
+        return series
+    if pd.api.types.is_integer_dtype(series):
+        return pd.to_numeric(series, downcast="integer")
+    if pd.api.types.is_float_dtype(series) and series.dtype != np.float32:
+        values = series.to_numpy()
+        narrowed = values.astype(np.float32)
+        if np.array_equal(narrowed.astype(values.dtype), values, equal_nan=True):
+            return pd.Series(narrowed, index=series.index, name=series.name)
+    return series
+
+
+def _infer_csv_dtypes(uploaded_file, compression=None, sample_rows=DTYPE_SAMPLE_ROWS):
+    """
+    Infer read_csv dtypes from a leading sample of the file.
+
+    Low-cardinality strings are pinned to category so every chunk shares
+    one representation. Numeric columns are left to per-chunk inference,
+    because a later chunk may contain missing values or text the sample did
+    not show; chunks of different dtypes are reconciled when concatenated.
+
+    Args:
+        uploaded_file (UploadedFile): The file returned by st.file_uploader
+        compression (str): Compression codec detected for the upload, if any
+        sample_rows (int): Number of leading rows to sample
+
+    Returns:
+        dict: Column name to dtype mapping for pd.read_csv
+    """
+    source, pandas_compression, _ = _csv_source(uploaded_file, compression)
+    sample = pd.read_csv(source, compression=pandas_compression, nrows=sample_rows)
+
+    dtypes = {}
+    for column in sample.columns:
+        series = sample[column]
+        if series.dtype == object:
+            if series.nunique() <= max(1, len(series) // 2):
+                dtypes[column] = "category"
+            else:
+                dtypes[column] = "str"
+    return dtypes
+
+
+def _concat_chunks(chunks):
+    """
+    Concatenate parsed chunks column by column, releasing each chunk column
+    as soon as it has been copied into the result.
+
+    Categorical columns are combined with union_categoricals so chunks with
+    different categories do not fall back to object dtype.
+    """
+    columns = {}
+    for column in list(chunks[0].columns):
+        parts = [chunk.pop(column) for chunk in chunks]
+        if all(isinstance(part.dtype, pd.CategoricalDtype) for part in parts):
+            columns[column] = pd.Series(union_categoricals(parts, ignore_order=True), name=column)
+        else:
+            columns[column] = pd.concat(parts, ignore_index=True)
+        del parts
+    return pd.DataFrame(columns)
+
+
+def read_csv_streaming(uploaded_file, compression=None, chunk_rows=CSV_CHUNK_ROWS):
+    """
+    Parse a large CSV upload in chunks with a sidebar progress bar.
+
+    Dtypes are inferred from a leading sample, each chunk is downcast before
+    it is kept, and chunks are combined column by column, so peak memory
+    stays close to the size of the final frame.
+
+    Args:
+        uploaded_file (UploadedFile): The file returned by st.file_uploader
+        compression (str): Compression codec detected for the upload, if any
+        chunk_rows (int): Number of rows parsed per chunk
+
+    Returns:
+        pandas.DataFrame: The parsed data
+    """
+    dtypes = _infer_csv_dtypes(uploaded_file, compression)
+    total_bytes = max(uploaded_file.size, 1)
+    progress = st.sidebar.progress(0.0, text="Parsing CSV...")
+
+    chunks = []
+    rows = 0
+    source, pandas_compression, raw = _csv_source(uploaded_file, compression)
+    reader = pd.read_csv(source, compression=pandas_compression, dtype=dtypes, chunksize=chunk_rows)
+    with reader:
+        for chunk in reader:
+            for column in chunk.columns:
+                chunk[column] = _downcast_series(chunk[column])
+            chunks.append(chunk)
+            rows += len(chunk)
+            fraction = min(raw.tell() / total_bytes, 1.0)
+            progress.progress(fraction, text=f"Parsing CSV... {rows:,} rows")
+
+    progress.progress(1.0, text=f"Combining {len(chunks)} chunks...")
+    if chunks:
+        data = _concat_chunks(chunks)
+    else:
+        # Header-only file: parse it once more to get the empty frame
+        source, pandas_compression, _ = _csv_source(uploaded_file, compression)
+        data = pd.read_csv(source, compression=pandas_compression, dtype=dtypes)
+    progress.empty()
+    return data
+
+
+def _parse_date_column(series, sample_rows=DATE_SAMPLE_ROWS):
+    """
+    Parse a string column as datetimes if a sample of it follows one date format.
+
+    The format is guessed from the leading values of the sample and checked
+    against the whole sample before the column is converted in one
+    vectorized call. The conversion is kept only if every non-null value
+    parses, so values written in another format are never silently turned
+    into NaT. Categorical columns only parse their categories.
+
+    Args:
+        series (pandas.Series): An object or categorical column
+        sample_rows (int): Number of non-null values used for detection
+
+    Returns:
+        pandas.Series: The datetime64 column, or None if it is not date-like
+    """
+    is_categorical = isinstance(series.dtype, pd.CategoricalDtype)
+    if is_categorical:
+        sample = pd.Series(series.cat.categories[:sample_rows])
+    else:
+        sample = series.dropna().head(sample_rows)
+    if sample.empty or not all(isinstance(value, str) for value in sample):
+        return None
+
+    guesses = sample.head(DATE_FORMAT_GUESSES).map(guess_datetime_format).dropna()
+    if guesses.empty:
+        return None
+    date_format = guesses.mode().iloc[0]
+    # Reject bare years or times that happen to look like dates
+    if not any(token in date_format for token in ("%Y", "%y")):
+        return None
+    if not any(token in date_format for token in ("%m", "%b", "%B")):
+        return None
+
+    parsed = pd.to_datetime(sample, format=date_format, errors="coerce")
+    if parsed.isna().any():
+        return None
+
+    if is_categorical:
+        categories = pd.to_datetime(series.cat.categories, format=date_format, errors="coerce")
+        if categories.isna().any():
+            return None
+        codes = series.cat.codes.to_numpy()
+        values = categories.to_numpy()[codes]
+        values[codes < 0] = np.datetime64("NaT")
+        return pd.Series(values, index=series.index, name=series.name)
+    converted = pd.to_datetime(series, format=date_format, errors="coerce")
+    if converted.isna().sum() != series.isna().sum():
+        return None
+    return converted
+
+
+def optimize_dtypes(data):
+    """
+    Compact column dtypes without losing information.
+
+    String columns that follow a single date format are parsed as datetimes,
+    other low-cardinality object columns become categoricals and numeric
+    columns are downcast to the narrowest dtype that holds every value exactly.
+
+    Args:
+        data (pandas.DataFrame): The freshly loaded dataframe
+
+    Returns:
+        tuple: (optimized DataFrame, per-column memory report DataFrame)
+    """
+    columns = {}
+    rows = []
+    for column, series in data.items():
+        before_dtype = series.dtype
+        before_bytes = _series_nbytes(series)
+
+        if series.dtype == object or isinstance(series.dtype, pd.CategoricalDtype):
+            parsed = _parse_date_column(series)
+            if parsed is not None:
+                series = parsed
+            elif series.dtype == object:
+                if series.nunique(dropna=True) <= max(1, int(len(series) * CATEGORY_MAX_UNIQUE_RATIO)):
+                    series = series.astype("category")
+        else:
+            series = _downcast_series(series)
+
+        columns[column] = series
+        rows.append({
+            "Column": str(column),
+            "Before dtype": str(before_dtype),
+            "After dtype": str(series.dtype),
+            "Before (MB)": before_bytes / 1024 ** 2,
+            "After (MB)": _series_nbytes(series) / 1024 ** 2,
+        })
+
+    optimized = pd.DataFrame(columns, index=data.index)
+    report = pd.DataFrame(rows, columns=["Column", "Before dtype", "After dtype", "Before (MB)", "After (MB)"])
+    return optimized, report
+
+
+def _show_memory_report(report):
+    """
+    Display the per-column before/after memory table in the sidebar.
+    """
+    before = report["Before (MB)"].sum()
+    after = report["After (MB)"].sum()
+    ratio = before / after if after else 1.0
+    with st.sidebar.expander(f"Memory: {before:,.1f} MB → {after:,.1f} MB ({ratio:.1f}x smaller)"):
+        st.dataframe(
+            report,
+            hide_index=True,
+            use_container_width=True,
+            column_config={
+                "Before (MB)": st.column_config.NumberColumn(format="%.2f"),
+                "After (MB)": st.column_config.NumberColumn(format="%.2f"),
+            }
+        )
+
+
+def _load_dataset(uploaded_file, fingerprint, streaming):
+    """
+    Return the parsed, dtype-optimized dataset for an upload, going through
+    the in-memory cache, then the on-disk cache, and parsing only on a miss.
+
+    Returns:
+        tuple: (data, memory report, source) where source describes which
+            layer served the request
+    """
+    cache = _dataset_cache()
+    cached = cache.get(fingerprint)
+    if cached is not None:
+        return cached + ("cache hit",)
+
+    cached = _read_disk_cache(fingerprint)
+    source = "disk cache"
+    if cached is None:
+        data, report = optimize_dtypes(read_upload(uploaded_file, streaming))
+        _write_disk_cache(fingerprint, data, report)
+        cached = (data, report)
+        source = "parsed"
+
+    cache.put(fingerprint, cached, _frame_nbytes(cached[0]))
+    return cached + (source,)
+
 
 def load_data():
     """
-    Load CSV data using Streamlit's file uploader.
+    Load data using Streamlit's file uploader.
+
+    CSV (plain or gzip/bz2/zstd/zip/xz compressed), Parquet and Feather/Arrow
+    IPC uploads are accepted; the format is detected from the file contents.
+
+    Parsed frames are cached by a fingerprint of the uploaded bytes, so
+    reruns reuse them and only a new or changed file is parsed again. The
+    first parse is also written to an Arrow file on disk, which later
+    sessions memory-map instead of parsing the text. Column dtypes are
+    compacted once after parsing and a memory report is shown.
+
+    Returns:
+        pandas.DataFrame: The loaded data or None if no file is uploaded.
+    """
+    st.sidebar.header("Upload Data")
+
+    uploaded_file = st.sidebar.file_uploader(
+        "Choose a data file",
+        type=UPLOAD_TYPES,
+        help="Upload your auto dealership data as CSV (optionally compressed), Parquet or Feather"
+    )
+
+    if uploaded_file is not None:
+        streaming = st.sidebar.checkbox(
+            "Streaming ingestion",
+            value=uploaded_file.size >= STREAMING_THRESHOLD_BYTES,
+            help="Parse CSV files in chunks with a progress bar to keep peak memory low on very large uploads"
+        )
+
+        try:
+            start = time.perf_counter()
+            fingerprint = _fingerprint(uploaded_file)
+            if streaming:
+                fingerprint = f"{fingerprint}:chunked"
+            data, report, source = _load_dataset(uploaded_file, fingerprint, streaming)
+
+            st.session_state["dataset_fingerprint"] = fingerprint
+            elapsed = time.perf_counter() - start
+            st.sidebar.success(
+                f"Successfully loaded data with {data.shape[0]} rows and {data.shape[1]} columns "
+                f"({source}, {elapsed:.2f}s)"
+            )
+            if report is not None:
+                _show_memory_report(report)
+            return data
+        except Exception as e:
+            st.sidebar.error(f"Error loading data: {e}")
+            return None
+    else:
+        st.sidebar.info("Please upload a data file to begin analysis")
+        return None
+
+
+def get_cleaned(data, fingerprint, target, group_columns, method):
+    """
+    Return the cleaned dataset, its cleaning log and its fingerprint, cached
+    next to the loaded data in the dataset cache.
+
+    The fingerprint is derived from the dataset's and the cleaning options,
+    so everything cached for the cleaned data is kept apart from the raw data.
+
+    Returns:
+        tuple: (cleaned dataframe, cleaning log DataFrame, fingerprint)
+    """
+    clean_fingerprint = None
+    if fingerprint is not None:
+        clean_fingerprint = f"{fingerprint}:clean:{method}:{target}:{','.join(map(str, group_columns))}"
+        cached = _dataset_cache().get(clean_fingerprint)
+        if cached is not None:
+            return cached + (clean_fingerprint,)
+
+    cleaned, log = clean_data(data, target, tuple(group_columns), method)
+    if fingerprint is not None:
+        _dataset_cache().put(clean_fingerprint, (cleaned, log), _frame_nbytes(cleaned))
+    return cleaned, log, clean_fingerprint
+
+
+def _show_cleaning_log(log):
+    """
+    Display the cleaning log in the sidebar.
+    """
+    dropped = int(log.loc[log["Step"].str.startswith("Rows dropped"), "Count"].sum())
+    imputed = int(log.loc[log["Step"].str.startswith("Outliers imputed"), "Count"].sum())
+    with st.sidebar.expander(f"Cleaning log: {dropped:,} rows dropped, {imputed:,} values imputed"):
+        st.dataframe(log, hide_index=True, use_container_width=True)
+
+
+def data_cleaning(data, fingerprint=None):
+    """
+    Render the cleaning controls and return the frame to work with.
+
+    When enabled, rows with nulls or blanks are dropped and outliers of the
+    chosen column are replaced by the mean of their group, as computed by
+    cleaning.clean_data.
+
+    Returns:
+        tuple: (dataframe, fingerprint) of the cleaned data when cleaning is
+            on, otherwise the loaded data and its fingerprint unchanged
+    """
+    numeric = [column for column, dtype in data.dtypes.items() if pd.api.types.is_numeric_dtype(dtype)]
+    with st.sidebar.expander("Data Cleaning", expanded=False):
+        enabled = st.toggle(
+            "Clean data",
+            key="clean_mode",
+            help="Drop rows with nulls or blanks and impute outliers with the mean of their group"
+        )
+        target = st.selectbox(
+            "Impute outliers in",
+            numeric,
+            index=numeric.index(DEFAULT_TARGET_COLUMN) if DEFAULT_TARGET_COLUMN in numeric else 0,
+            key="clean_target",
+            disabled=not enabled
+        )
+        group_columns = st.multiselect(
+            "Compare within groups of",
+            options=list(data.columns),
+            default=[column for column in DEFAULT_GROUP_COLUMNS if column in data.columns],
+            key="clean_groups",
+            disabled=not enabled
+        )
+        method = st.radio("Outlier rule", OUTLIER_METHODS, horizontal=True, key="clean_method", disabled=not enabled)
+
+    if not enabled:
+        return data, fingerprint
+
+    cleaned, log, clean_fingerprint = get_cleaned(data, fingerprint, target, group_columns, method)
+    _show_cleaning_log(log)
+    return cleaned, clean_fingerprint
+
+
+def draw_sample(data, rows, strata=None, seed=0):
+    """
+    Draw a reproducible random sample of row positions.
+
+    A stratified sample allocates rows to each combination of the strata
+    columns in proportion to its size, with at least one row per
+    combination, so rare groups still show up in the filters. Rows are
+    shuffled once and then stably sorted by group (a radix sort when the
+    group numbers fit in 16 bits), so each group's leading rows form its
+    random sample without a Python loop over groups.
+
+    Args:
+        data (pandas.DataFrame): The full dataframe
+        rows (int): Target number of rows
+        strata (list): Columns to stratify by, or None for a uniform sample
+        seed (int): Seed of the random generator
+
+    Returns:
+        numpy.ndarray: Sorted row positions of the sample
+    """
+    rng = np.random.default_rng(seed)
+    if rows >= len(data):
+        return _row_positions(np.arange(len(data)))
+    if not strata:
+        return _row_positions(np.sort(rng.choice(len(data), size=rows, replace=False)))
+
+    groups = data.groupby(list(strata), observed=True, sort=False, dropna=False).ngroup().to_numpy()
+    sizes = np.bincount(groups)
+    quotas = np.maximum(np.round(sizes * (rows / len(data))), 1).astype(np.int64)
+
+    if len(sizes) <= np.iinfo(np.uint16).max:
+        groups = groups.astype(np.uint16)
+    shuffled = rng.permutation(len(data))
+    order = shuffled[np.argsort(groups[shuffled], kind="stable")]
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    sorted_groups = groups[order]
+    rank = np.arange(len(data)) - starts[sorted_groups]
+    return _row_positions(np.sort(order[rank < quotas[sorted_groups]]))
+
+
+def get_sample(data, fingerprint, rows, strata=None):
+    """
+    Return a sample of the dataset and its fingerprint, cached next to the
+    full data in the dataset cache.
+
+    The sample's fingerprint is derived from the dataset's and the sampling
+    parameters, so profiles, indexes and filter results of the sample are
+    cached separately from those of the full data.
+
+    Returns:
+        tuple: (sample dataframe, sample fingerprint)
+    """
+    strata = tuple(strata or ())
+    sample_fingerprint = None
+    if fingerprint is not None:
+        sample_fingerprint = f"{fingerprint}:sample:{rows}:{','.join(map(str, strata)) or 'uniform'}"
+        cached = _dataset_cache().get(sample_fingerprint)
+        if cached is not None:
+            return cached[0], sample_fingerprint
+
+    sample = data.take(draw_sample(data, rows, strata))
+    if fingerprint is not None:
+        _dataset_cache().put(sample_fingerprint, (sample, None), _frame_nbytes(sample))
+    return sample, sample_fingerprint
+
+
+def sample_data(data, fingerprint=None):
+    """
+    Render the sampling controls and return the frame to explore.
+
+    Returns:
+        tuple: (dataframe, fingerprint) of the sample when sampling is on,
+            otherwise the full data and its fingerprint unchanged
+    """
+    panel = st.sidebar.expander("Sampling", expanded=len(data) >= SAMPLE_AUTO_ROWS)
+    with panel:
+        enabled = st.toggle(
+            "Explore a sample",
+            value=len(data) >= SAMPLE_AUTO_ROWS,
+            key="sample_mode",
+            help="Run filters and previews on a random sample; exact aggregates stay available"
+        )
+        rows = st.number_input(
+            "Sample rows",
+            min_value=1_000,
+            value=SAMPLE_DEFAULT_ROWS,
+            step=100_000,
+            key="sample_rows",
+            disabled=not enabled
+        )
+        strata = st.multiselect(
+            "Stratify by",
+            options=list(data.columns),
+            key="sample_strata",
+            disabled=not enabled,
+            help="Sample each combination of these columns in proportion to its size, e.g. Make and State"
+        )
+
+    if not enabled or rows >= len(data):
+        return data, fingerprint
+
+    sample, sample_fingerprint = get_sample(data, fingerprint, int(rows), strata)
+    kind = f"stratified (by {', '.join(map(str, strata))})" if strata else "uniform"
+    st.warning(
+        f"Sampling mode: exploring a {kind} sample of {len(sample):,} of {len(data):,} rows. "
+        "Filter counts and previews below describe the sample; use Exact Aggregates for full-data numbers."
+    )
+    return sample, sample_fingerprint
+
+
+def exact_aggregates(data, fingerprint=None, spec=None):
+    """
+    Compute exact aggregates of the current filters on the full data, on request.
+
+    The filtered frame is never built: each numeric column is gathered at
+    the matching row positions and aggregated on its own, so only one column
+    of the selection is held in memory at a time.
+
+    Args:
+        data (pandas.DataFrame): The full dataframe
+        fingerprint (str): Fingerprint of the full dataset
+        spec (FilterSpec): The filters chosen on the sample
+    """
+    with st.expander("Exact Aggregates", expanded=False):
+        if not st.button("Compute on full data", key="exact_aggregates"):
+            st.caption("Applies the current filters to every row of the dataset.")
+            return
+
+        positions = filter_rows(data, spec or FilterSpec(), fingerprint, cache=_filter_cache())
+        total = len(data) if positions is None else len(positions)
+        st.metric("Matching rows", f"{total:,}", help=f"Out of {len(data):,} rows")
+
+        aggregates = {}
+        for column, series in data.items():
+            if not pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+                continue
+            values = series if positions is None else series.iloc[positions]
+            if pd.api.types.is_float_dtype(values):
+                # Float columns may be downcast to float32; sum in full precision
+                values = values.astype("float64")
+            aggregates[column] = values.agg(["count", "sum", "mean", "min", "max"])
+        if aggregates:
+            st.dataframe(pd.DataFrame.from_dict(aggregates, orient="index"), use_container_width=True)
+
+@dataclass
+class ColumnProfile:
+    """
+    Summary of one column, computed once per dataset and used to build its filter widget.
+
+    kind is "categorical", "datetime" or "continuous". values holds the
+    sorted distinct non-null values for categorical columns only.
+    """
+    name: object
+    kind: str
+    dtype: str
+    null_count: int
+    distinct_count: int
+    min: object = None
+    max: object = None
+    values: np.ndarray = None
+    _lookup: pd.Index = field(default=None, repr=False, compare=False)
+
+    @property
+    def nbytes(self):
+        # Distinct strings dominate the size of text profiles, not their pointers
+        return 0 if self.values is None else _series_nbytes(pd.Series(self.values, copy=False))
+
+    def known(self, values):
+        """
+        Return the given values that occur in the column, in their order.
+
+        The hash table over the distinct values is built once per profile,
+        so each check costs the number of values checked.
+        """
+        values = list(values)
+        if self.values is None or not values:
+            return values
+        if self._lookup is None:
+            self._lookup = pd.Index(self.values)
+        found = self._lookup.get_indexer(pd.Index(values, dtype=object)) >= 0
+        return [value for value, present in zip(values, found) if present]
+
+
+@_shared_cache
+def _profile_cache():
+    """
+    Process-wide cache of column profiles keyed by (fingerprint, column).
+    """
+    return LRUCache(PROFILE_CACHE_MAX_BYTES)
+
+
+def _sorted_values(values):
+    """
+    Sort distinct values, falling back to their string form for mixed types.
+    """
+    try:
+        return np.sort(values)
+    except TypeError:
+        return np.sort(values.astype(str))
+
+
+def profile_column(series):
+    """
+    Profile a column with a single hashing pass over its values.
+
+    Distinct values are computed once; the null count, distinct count and
+    min/max are then derived from that (usually much smaller) array.
+    Categorical columns reuse their integer codes instead of hashing.
+
+    Args:
+        series (pandas.Series): The column to profile
+
+    Returns:
+        ColumnProfile: The column profile
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes = series.cat.codes.to_numpy()
+        present = codes >= 0
+        counts = np.bincount(codes[present], minlength=len(series.cat.categories))
+        uniques = series.cat.categories.to_numpy()[counts > 0]
+        null_count = int(len(codes) - present.sum())
+    else:
+        if pd.api.types.is_datetime64_any_dtype(series):
+            # Profile tz-aware columns in wall-clock time, as they are filtered
+            values = _datetime_values(series)
+        else:
+            values = series.to_numpy()
+        uniques = pd.unique(values)
+        missing = pd.isna(uniques)
+        null_count = int(series.isna().sum()) if missing.any() else 0
+        uniques = uniques[~missing]
+
+    is_numeric = pd.api.types.is_numeric_dtype(series)
+    is_datetime = pd.api.types.is_datetime64_any_dtype(series)
+    if is_datetime:
+        kind = "datetime"
+    elif is_numeric and len(uniques) >= CATEGORICAL_MAX_UNIQUE:
+        kind = "continuous"
+    else:
+        kind = "categorical"
+
+    profile = ColumnProfile(
+        name=series.name,
+        kind=kind,
+        dtype=str(series.dtype),
+        null_count=null_count,
+        distinct_count=len(uniques),
+    )
+    if kind == "categorical":
+        profile.values = _sorted_values(uniques)
+        if len(profile.values):
+            profile.min, profile.max = profile.values[0], profile.values[-1]
+    elif len(uniques):
+        profile.min, profile.max = uniques.min(), uniques.max()
+    return profile
+
+
+def get_profile(data, fingerprint=None, columns=None):
+    """
+    Return the profiles of the requested columns, cached per column.
+
+    Columns are profiled lazily: each one is scanned the first time it is
+    requested. Profiles are cached one column at a time, so a large profile
+    only evicts other columns' profiles instead of the whole dataset's.
+
+    Args:
+        data (pandas.DataFrame): The loaded dataframe
+        fingerprint (str): Fingerprint of the dataset, or None to skip caching
+        columns (list): Columns to profile, or None for every column
+
+    Returns:
+        dict: Column name to ColumnProfile, in the requested order
+    """
+    if columns is None:
+        columns = list(data.columns)
+
+    cache = _profile_cache()
+    profile = {}
+    for column in columns:
+        column_profile = cache.get((fingerprint, column)) if fingerprint is not None else None
+        if column_profile is None:
+            column_profile = profile_column(data[column])
+            if fingerprint is not None:
+                cache.put((fingerprint, column), column_profile, column_profile.nbytes)
+        profile[column] = column_profile
+    return profile
+
+
+def default_filter_columns(data, limit=DEFAULT_FILTER_COLUMNS):
+    """
+    Pick the columns offered in the filter panel when a dataset is first shown.
+
+    Only dtypes are inspected, so the choice costs nothing on wide tables:
+    dates come first, then short categoricals, then booleans and numbers,
+    then longer categoricals.
+
+    Args:
+        data (pandas.DataFrame): The loaded dataframe
+        limit (int): Maximum number of columns to pick
+
+    Returns:
+        list: Column names, in dataframe order
+    """
+    ranked = []
+    for position, (column, dtype) in enumerate(data.dtypes.items()):
+        if pd.api.types.is_datetime64_any_dtype(dtype):
+            rank = (0, 0)
+        elif isinstance(dtype, pd.CategoricalDtype) and len(dtype.categories) <= CATEGORICAL_MAX_UNIQUE:
+            rank = (1, len(dtype.categories))
+        elif pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_numeric_dtype(dtype):
+            rank = (2, 0)
+        elif isinstance(dtype, pd.CategoricalDtype):
+            rank = (3, len(dtype.categories))
+        else:
+            continue
+        ranked.append((rank, position, column))
+
+    picked = sorted(ranked)[:limit]
+    return [column for _, _, column in sorted(picked, key=lambda item: item[1])]
+
+
+def _column_picker(data, fingerprint):
+    """
+    Render the picker choosing which columns get a filter widget.
+
+    The selection is kept per dataset, starting from default_filter_columns.
+
+    Returns:
+        list: The picked column names, in dataframe order
+    """
+    key = f"filter_columns_{fingerprint}"
+    if key not in st.session_state:
+        st.session_state[key] = default_filter_columns(data)
+
+    picked = set(st.multiselect(
+        "Columns to filter",
+        options=list(data.columns),
+        key=key,
+        help="Only these columns are profiled and get a filter widget"
+    ))
+    return [column for column in data.columns if column in picked]
+
+
+def predicate_mask(data, predicate):
+    """
+    Evaluate one filter predicate as a boolean mask over the source columns.
+
+    Args:
+        data (pandas.DataFrame): The unfiltered dataframe
+        predicate (tuple): (column, op, argument) where op is "isin" with a
+            list of values or "between" with inclusive (low, high) bounds;
+            datetime bounds are Timestamps. A (None, "expr", text) predicate
+            holds a filter expression over any columns.
+
+    Returns:
+        numpy.ndarray: Boolean mask with one entry per row
+    """
+    column, op, argument = predicate
+    series = data[column] if column is not None else None
+    if op == "isin":
+        return series.isin(argument).to_numpy()
+    if op == "expr":
+        return compile_expression(argument, column_kinds(data))(data)
+    if op == "between":
+        low, high = _range_bounds(argument)
+        if pd.api.types.is_datetime64_any_dtype(series):
+            values = _datetime_values(series)
+        else:
+            values = series.to_numpy()
+        return (values >= low) & (values <= high)
+    raise ValueError(f"Unknown filter operation: {op}")
+
+
+def _range_bounds(argument):
+    """
+    Convert range bounds to numpy scalars, so datetime ranges compare as
+    datetime64 without building Python objects per row.
+    """
+    return tuple(
+        bound.to_datetime64() if isinstance(bound, pd.Timestamp) else bound
+        for bound in argument
+    )
+
+
+def combine_masks(data, predicates):
+    """
+    AND the masks of all predicates together.
+
+    Returns:
+        numpy.ndarray: Combined boolean mask, or None when there are no predicates
+    """
+    mask = None
+    for predicate in predicates:
+        if mask is None:
+            mask = predicate_mask(data, predicate)
+        else:
+            mask &= predicate_mask(data, predicate)
+    return mask
+
+
+def _row_positions(positions):
+    """
+    Store row positions in the narrowest integer type that can address them.
+    """
+    if len(positions) and positions.max() < np.iinfo(np.int32).max:
+        return positions.astype(np.int32)
+    return positions.astype(np.int64)
+
+
+def _datetime_values(series):
+    """
+    Return datetime values as a naive datetime64 array in wall-clock time.
+    """
+    if getattr(series.dt, "tz", None) is not None:
+        series = series.dt.tz_localize(None)
+    return series.to_numpy()
+
+
+class SortedIndex:
+    """
+    Row positions of a numeric or datetime column ordered by value.
+
+    Range queries are two binary searches and return a contiguous slice of
+    row positions. Missing values are left out of the index.
+    """
+
+    def __init__(self, series):
+        if pd.api.types.is_datetime64_any_dtype(series):
+            values = _datetime_values(series)
+        else:
+            values = series.to_numpy()
+        valid = len(values) - int(pd.isna(values).sum())
+        # NaN and NaT sort last, so the valid rows are a prefix of the order
+        order = np.argsort(values, kind="stable")[:valid]
+        self.order = _row_positions(order)
+        self.sorted_values = values[order]
+
+    @property
+    def nbytes(self):
+        return self.order.nbytes + self.sorted_values.nbytes
+
+    def range(self, low, high):
+        """
+        Return the positions of rows with low <= value <= high.
+        """
+        start = np.searchsorted(self.sorted_values, low, side="left")
+        stop = np.searchsorted(self.sorted_values, high, side="right")
+        return self.order[start:stop]
+
+
+class InvertedIndex:
+    """
+    Row positions of a categorical column grouped by value.
+
+    Positions are stored as one array ordered by value code with an offset
+    per value, so a membership query concatenates one slice per value.
+    """
+
+    def __init__(self, series):
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            codes = series.cat.codes.to_numpy()
+            keys = series.cat.categories
+        else:
+            codes, keys = pd.factorize(series)
+        # Shift codes so missing values (-1) form group 0
+        counts = np.bincount(codes + 1, minlength=len(keys) + 1)
+        self.keys = pd.Index(keys)
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+        self.order = _row_positions(np.argsort(codes, kind="stable"))
+
+    @property
+    def nbytes(self):
+        return self.order.nbytes + self.offsets.nbytes
+
+    def lookup(self, values):
+        """
+        Return the positions of rows whose value is one of values.
+        """
+        locations = self.keys.get_indexer(pd.Index(values).unique())
+        groups = [
+            self.order[self.offsets[location + 1]:self.offsets[location + 2]]
+            for location in locations if location >= 0
+        ]
+        if not groups:
+            return self.order[:0]
+        return np.concatenate(groups)
+
+
+class PrefixIndex:
+    """
+    Case-insensitive prefix search over the sorted distinct values of a column.
+
+    Values are kept ordered by their case-folded text, so every value with a
+    given prefix lies in one contiguous range found by two binary searches.
+    """
+
+    def __init__(self, values):
+        keys = pd.Series(values, dtype=object).astype(str).str.casefold().to_numpy(dtype=object)
+        order = np.argsort(keys, kind="stable")
+        self.keys = keys[order]
+        self.values = np.asarray(values)[order]
+
+    @property
+    def nbytes(self):
+        return _series_nbytes(pd.Series(self.keys)) + self.values.nbytes
+
+    def search(self, prefix, limit=SEARCH_MAX_MATCHES):
+        """
+        Return up to limit values starting with prefix, and the total match count.
+        """
+        prefix = prefix.casefold()
+        start = np.searchsorted(self.keys, prefix, side="left")
+        stop = np.searchsorted(self.keys, prefix + "\U0010ffff", side="left")
+        return self.values[start:min(stop, start + limit)], int(stop - start)
+
+
+class SortOrder:
+    """
+    Row positions of any column ordered by value, with missing values last.
+
+    Categorical columns are ordered by their category labels through the
+    integer codes, without decoding the values. Values of mixed types that
+    cannot be compared are ordered by their string form, as _sorted_values
+    does.
+    """
+
+    def __init__(self, series):
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            categories = series.cat.categories
+            try:
+                category_order = categories.argsort()
+            except TypeError:
+                category_order = categories.astype(str).argsort()
+            ranks = np.empty(len(categories) + 1, dtype=np.int64)
+            ranks[category_order] = np.arange(len(categories))
+            # Code -1 (missing) picks the last rank
+            ranks[-1] = len(categories)
+            order = np.argsort(ranks[series.cat.codes.to_numpy()], kind="stable")
+        else:
+            series = series.reset_index(drop=True)
+            try:
+                ordered = series.sort_values(kind="stable", na_position="last")
+            except TypeError:
+                ordered = series.map(str, na_action="ignore").sort_values(kind="stable", na_position="last")
+            order = ordered.index.to_numpy()
+        self.order = _row_positions(order)
+        self.valid = len(series) - int(series.isna().sum())
+
+    @property
+    def nbytes(self):
+        return self.order.nbytes
+
+    def rows(self, descending=False):
+        """
+        Return all row positions in sort order; missing values stay last.
+        """
+        if not descending:
+            return self.order
+        return np.concatenate([self.order[:self.valid][::-1], self.order[self.valid:]])
+
+
+@_shared_cache
+def _index_cache():
+    """
+    Process-wide cache of per-column indexes keyed by (fingerprint, column).
+    """
+    return LRUCache(INDEX_CACHE_MAX_BYTES)
+
+
+def get_index(data, fingerprint, column, op):
+    """
+    Return the index used to answer op on column, building it on first use.
+
+    Membership queries use an InvertedIndex; range queries a SortedIndex.
+    """
+    index_class = InvertedIndex if op == "isin" else SortedIndex
+    key = (fingerprint, column, index_class.__name__)
+    cache = _index_cache()
+    index = cache.get(key)
+    if index is None:
+        index = index_class(data[column])
+        cache.put(key, index, index.nbytes)
+    return index
+
+
+def get_prefix_index(column_profile, fingerprint):
+    """
+    Return the prefix search index over a column's distinct values,
+    building it on first use.
+    """
+    key = (fingerprint, column_profile.name, PrefixIndex.__name__)
+    cache = _index_cache()
+    index = cache.get(key) if fingerprint is not None else None
+    if index is None:
+        index = PrefixIndex(column_profile.values)
+        if fingerprint is not None:
+            cache.put(key, index, index.nbytes)
+    return index
+
+
+def get_sort_order(data, fingerprint, column):
+    """
+    Return the sort permutation of a column, computing it once per dataset.
+    """
+    key = (fingerprint, column, SortOrder.__name__)
+    cache = _index_cache()
+    sort_order = cache.get(key) if fingerprint is not None else None
+    if sort_order is None:
+        sort_order = SortOrder(data[column])
+        if fingerprint is not None:
+            cache.put(key, sort_order, sort_order.nbytes)
+    return sort_order
+
+
+def sorted_rows(data, fingerprint, column, descending=False, positions=None):
+    """
+    Order the selected rows by a column using the cached sort permutation.
+
+    The permutation is filtered through a bitmap of the selection, so no
+    values are compared again when the filter changes.
+
+    Args:
+        data (pandas.DataFrame): The unfiltered dataframe
+        fingerprint (str): Fingerprint of the dataset, used to cache the permutation
+        column (str): Column to sort by
+        descending (bool): Sort from the largest value
+        positions (numpy.ndarray): Selected row positions, or None for all rows
+
+    Returns:
+        numpy.ndarray: Row positions of the selection in sort order
+    """
+    order = get_sort_order(data, fingerprint, column).rows(descending)
+    if positions is None:
+        return order
+    bitmap = np.zeros(len(data), dtype=bool)
+    bitmap[positions] = True
+    return order[bitmap[order]]
+
+
+def predicate_rows(data, fingerprint, predicate):
+    """
+    Answer one filter predicate from the column's index.
+
+    Returns:
+        numpy.ndarray: Unordered positions of the matching rows
+    """
+    column, op, argument = predicate
+    if op == "expr":
+        # Expressions span several columns, so they are answered by a scan
+        return np.flatnonzero(predicate_mask(data, predicate))
+    index = get_index(data, fingerprint, column, op)
+    if op == "isin":
+        return index.lookup(argument)
+    if op == "between":
+        low, high = _range_bounds(argument)
+        return index.range(low, high)
+    raise ValueError(f"Unknown filter operation: {op}")
+
+
+def intersect_rows(data, fingerprint, predicates):
+    """
+    Intersect the row sets of all predicates using the column indexes.
+
+    The smallest row set is probed against a bitmap of each of the others,
+    so the cost follows the size of the matching row sets rather than the
+    length of the table.
+
+    Returns:
+        numpy.ndarray: Sorted positions of the rows matching every predicate
+    """
+    row_sets = sorted((predicate_rows(data, fingerprint, predicate) for predicate in predicates), key=len)
+    rows = row_sets[0]
+    if len(row_sets) > 1:
+        bitmap = np.zeros(len(data), dtype=bool)
+        for other in row_sets[1:]:
+            if not len(rows):
+                break
+            bitmap[other] = True
+            rows = rows[bitmap[rows]]
+            bitmap[other] = False
+    return np.sort(rows)
+
+
+class ExpressionError(ValueError):
+    """
+    Raised when a filter expression is malformed or does not fit the dataset.
+    """
+
+
+_COMPARISONS = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+}
+_ARITHMETIC = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+}
+
+
+def column_kinds(data):
+    """
+    Classify each column for expression checking as "numeric", "boolean",
+    "datetime" or "text".
+    """
+    kinds = {}
+    for column, dtype in data.dtypes.items():
+        if pd.api.types.is_bool_dtype(dtype):
+            kinds[column] = "boolean"
+        elif pd.api.types.is_numeric_dtype(dtype):
+            kinds[column] = "numeric"
+        elif pd.api.types.is_datetime64_any_dtype(dtype):
+            kinds[column] = "datetime"
+        else:
+            kinds[column] = "text"
+    return kinds
+
+
+def _logical_keywords(source):
+    """
+    Rewrite &, | and ~ as and, or and not, so they bind like the keywords
+    (as in pandas query strings) rather than like Python's bitwise operators.
+    """
+    replacements = {"&": "and", "|": "or", "~": "not"}
+    tokens = []
+    for token in tokenize.generate_tokens(io.StringIO(source).readline):
+        if token.type == tokenize.OP and token.string in replacements:
+            token = (tokenize.NAME, replacements[token.string])
+        else:
+            token = (token.type, token.string)
+        tokens.append(token)
+    return tokenize.untokenize(tokens)
+
+
+class CompiledExpression:
+    """
+    A validated filter expression compiled to vectorized column operations.
+
+    Calling it with a dataframe returns the boolean row mask. columns lists
+    the referenced columns and literals the (column, value) pairs compared
+    for equality or membership, for checks against the column profile.
+    """
+
+    def __init__(self, text, kinds):
+        self.text = text
+        self.columns = set()
+        self.literals = []
+        self._kinds = kinds
+        self._names = {}
+
+        # Backticks quote column names that are not Python identifiers
+        source = re.sub(r"`([^`]+)`", self._quote_column, text)
+        try:
+            tree = ast.parse(_logical_keywords(source.strip()), mode="eval")
+        except (SyntaxError, tokenize.TokenError) as e:
+            raise ExpressionError(f"Invalid syntax: {e.args[0]}") from None
+
+        self._evaluate, kind = self._compile(tree.body)
+        if kind != "boolean":
+            raise ExpressionError("The expression must be a condition, e.g. Price > 20000")
+
+    def __call__(self, data):
+        try:
+            result = self._evaluate(data)
+        except (TypeError, ValueError, ArithmeticError) as e:
+            raise ExpressionError(f"Cannot evaluate {self.text!r}: {e}") from None
+        if isinstance(result, pd.Series):
+            return result.to_numpy(dtype=bool, na_value=False)
+        return np.full(len(data), bool(result))
+
+    def _quote_column(self, match):
+        placeholder = f"__column_{len(self._names)}"
+        self._names[placeholder] = match.group(1)
+        return placeholder
+
+    def _compile(self, node):
+        """
+        Compile one syntax node into (evaluator, kind).
+        """
+        if isinstance(node, ast.Name):
+            column = self._names.get(node.id, node.id)
+            if column not in self._kinds:
+                raise ExpressionError(f"Unknown column: {column}")
+            self.columns.add(column)
+
+            def evaluator(data):
+                series = data[column]
+                # Dates are compared in wall-clock time, as in the date filters
+                if getattr(series.dtype, "tz", None) is not None:
+                    series = series.dt.tz_localize(None)
+                return series
+            evaluator.column = column
+            return evaluator, self._kinds[column]
+
+        if isinstance(node, ast.Constant):
+            value = node.value
+            if isinstance(value, bool):
+                kind = "boolean"
+            elif isinstance(value, (int, float)):
+                kind = "numeric"
+            elif isinstance(value, str):
+                kind = "text"
+            else:
+                raise ExpressionError(f"Unsupported value: {value!r}")
+            return _constant(value), kind
+
+        if isinstance(node, ast.BoolOp):
+            parts = [self._compile_condition(value) for value in node.values]
+            combine = operator.and_ if isinstance(node.op, ast.And) else operator.or_
+
+            def evaluate_bool(data):
+                result = parts[0](data)
+                for part in parts[1:]:
+                    result = combine(result, part(data))
+                return result
+            return evaluate_bool, "boolean"
+
+        if isinstance(node, ast.UnaryOp):
+            if isinstance(node.op, ast.Not):
+                operand = self._compile_condition(node.operand)
+                return (lambda data: ~operand(data)), "boolean"
+            if isinstance(node.op, (ast.USub, ast.UAdd)):
+                operand, kind = self._compile(node.operand)
+                if kind != "numeric":
+                    raise ExpressionError("Signs can only be applied to numbers")
+                if isinstance(node.op, ast.USub):
+                    if hasattr(operand, "value"):
+                        return _constant(-operand.value), kind
+                    return (lambda data: -operand(data)), kind
+                return operand, kind
+
+        if isinstance(node, ast.BinOp):
+            if type(node.op) in _ARITHMETIC:
+                left, left_kind = self._compile(node.left)
+                right, right_kind = self._compile(node.right)
+                if left_kind != "numeric" or right_kind != "numeric":
+                    raise ExpressionError("Arithmetic is only supported between numeric values")
+                apply = _ARITHMETIC[type(node.op)]
+                if hasattr(left, "value") and hasattr(right, "value"):
+                    return _constant(_fold(apply, left.value, right.value, node)), "numeric"
+                return (lambda data: apply(left(data), right(data))), "numeric"
+
+        if isinstance(node, ast.Compare):
+            parts = []
+            left_node = node.left
+            for op, right_node in zip(node.ops, node.comparators):
+                parts.append(self._compile_comparison(left_node, op, right_node))
+                left_node = right_node
+
+            def evaluate_compare(data):
+                result = parts[0](data)
+                for part in parts[1:]:
+                    result = result & part(data)
+                return result
+            return evaluate_compare, "boolean"
+
+        raise ExpressionError(f"Unsupported syntax: {ast.unparse(node)}")
+
+    def _compile_condition(self, node):
+        evaluator, kind = self._compile(node)
+        if kind != "boolean":
+            raise ExpressionError(f"Expected a condition: {ast.unparse(node)}")
+        return evaluator
+
+    def _compile_comparison(self, left_node, op, right_node):
+        left, left_kind = self._compile(left_node)
+
+        if isinstance(op, (ast.In, ast.NotIn)):
+            if not isinstance(right_node, (ast.Tuple, ast.List, ast.Set)):
+                raise ExpressionError("'in' needs a list of values, e.g. State in ('TX', 'CA')")
+            values = [self._literal(element, left_kind, left) for element in right_node.elts]
+            negate = isinstance(op, ast.NotIn)
+
+            def evaluate_in(data):
+                operand = left(data)
+                if isinstance(operand, pd.Series):
+                    result = operand.isin(values)
+                else:
+                    result = operand in values
+                return ~result if negate else result
+            return evaluate_in
+
+        if type(op) not in _COMPARISONS:
+            raise ExpressionError(f"Unsupported comparison: {type(op).__name__}")
+        right, right_kind = self._compile(right_node)
+
+        # Date literals are written as strings and compared as timestamps
+        if left_kind == "datetime" and right_kind == "text" and hasattr(right, "value"):
+            right, right_kind = self._timestamp(right.value), "datetime"
+        elif right_kind == "datetime" and left_kind == "text" and hasattr(left, "value"):
+            left, left_kind = self._timestamp(left.value), "datetime"
+
+        if left_kind != right_kind:
+            raise ExpressionError(f"Cannot compare {left_kind} with {right_kind}: {ast.unparse(left_node)} {ast.unparse(right_node)}")
+        if left_kind in ("text", "boolean") and not isinstance(op, (ast.Eq, ast.NotEq)):
+            raise ExpressionError(f"{left_kind.capitalize()} values can only be compared with == and !=")
+
+        for column_side, value_side in ((left, right), (right, left)):
+            if isinstance(op, ast.Eq) and hasattr(column_side, "column") and hasattr(value_side, "value"):
+                self.literals.append((column_side.column, value_side.value))
+
+        compare = _COMPARISONS[type(op)]
+        return lambda data: compare(left(data), right(data))
+
+    def _literal(self, node, kind, column_evaluator):
+        if not isinstance(node, ast.Constant):
+            raise ExpressionError(f"Lists may only contain values: {ast.unparse(node)}")
+        value = node.value
+        if kind == "datetime" and isinstance(value, str):
+            value = self._timestamp(value).value
+        else:
+            _, value_kind = self._compile(node)
+            if value_kind != kind:
+                raise ExpressionError(f"Cannot compare {kind} with {value_kind}: {ast.unparse(node)}")
+        if hasattr(column_evaluator, "column"):
+            self.literals.append((column_evaluator.column, value))
+        return value
+
+    def _timestamp(self, text):
+        try:
+            value = pd.Timestamp(text).to_datetime64()
+        except ValueError:
+            raise ExpressionError(f"Not a date: {text!r}") from None
+        return _constant(value)
+
+
+def _constant(value):
+    """
+    Return an evaluator for a constant, exposing the value for folding and
+    profile checks.
+    """
+    evaluator = lambda data: value
+    evaluator.value = value
+    return evaluator
+
+
+def _fold(apply, left, right, node):
+    """
+    Compute arithmetic between two constants once, at compile time.
+
+    Integer powers are bounded before they are computed, so a literal such
+    as 10 ** 10 ** 7 cannot stall the server.
+    """
+    if (apply is operator.pow and isinstance(left, int) and isinstance(right, int)
+            and abs(left) > 1 and right * left.bit_length() > EXPRESSION_MAX_INT_BITS):
+        raise ExpressionError(f"Number too large: {ast.unparse(node)}")
+    try:
+        value = apply(left, right)
+    except (ArithmeticError, ValueError) as e:
+        raise ExpressionError(f"Cannot compute {ast.unparse(node)}: {e}") from None
+    if isinstance(value, int) and value.bit_length() > EXPRESSION_MAX_INT_BITS:
+        raise ExpressionError(f"Number too large: {ast.unparse(node)}")
+    return value
+
+
+# Quoted strings and backtick-quoted column names, whose spacing is significant
+_QUOTED = re.compile(r"""('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"|`[^`]*`)""")
+
+
+def normalize_expression(text):
+    """
+    Collapse runs of whitespace in an expression, except inside quotes.
+
+    Expressions that differ only in spacing between tokens normalize to the
+    same text, while literals such as 'F  150' keep their exact value.
+    """
+    parts = _QUOTED.split(text)
+    # Odd parts are the quoted segments captured by the split
+    return "".join(
+        part if i % 2 else re.sub(r"\s+", " ", part)
+        for i, part in enumerate(parts)
+    ).strip()
+
+
+@_shared_cache
+def _expression_cache():
+    """
+    Process-wide cache of compiled filter expressions keyed by expression
+    text and the column kinds they were checked against.
+    """
+    return LRUCache(EXPRESSION_CACHE_SIZE)
+
+
+def compile_expression(text, kinds):
+    """
+    Compile a filter expression, reusing an earlier compilation of the same text.
+
+    Expressions combine column names, numbers, quoted strings and dates with
+    and/or/not, comparisons, 'in (...)' and + - * / % **. Column names that
+    are not identifiers are written in backticks.
+
+    Args:
+        text (str): The expression, e.g. "Price > 1.2 * MSRP and State in ('TX', 'CA')"
+        kinds (dict): Column name to kind, as returned by column_kinds
+
+    Returns:
+        CompiledExpression: Callable returning the boolean row mask
+
+    Raises:
+        ExpressionError: If the expression is invalid for these columns
+    """
+    key = (normalize_expression(text), tuple(kinds.items()))
+    cache = _expression_cache()
+    compiled = cache.get(key)
+    if compiled is None:
+        compiled = CompiledExpression(text, kinds)
+        cache.put(key, compiled, 1)
+    return compiled
+
+
+def _expression_filter(data, fingerprint):
+    """
+    Render the advanced expression box and validate its contents against
+    the profiles of the columns it mentions.
+
+    Returns:
+        str: The expression text, or None when it is empty or invalid
+    """
+    text = st.text_input(
+        "Filter expression",
+        key="filter_expression",
+        placeholder="e.g. Price > 1.2 * MSRP and State in ('TX', 'CA')",
+        help=(
+            "Combine columns with and, or, not, comparisons, in (...) and arithmetic. "
+            "Quote text and dates, and wrap column names containing spaces in backticks."
+        )
+    )
+    if not text.strip():
+        return None
+
+    try:
+        compiled = compile_expression(text, column_kinds(data))
+        # Evaluation errors depend on dtypes, not on values, so a few rows show them
+        compiled(data.head(EXPRESSION_TRIAL_ROWS))
+    except ExpressionError as e:
+        st.error(f"Expression ignored: {e}")
+        return None
+
+    # Column names may mix types, so they keep the expression's order
+    profile = get_profile(data, fingerprint, list(dict.fromkeys(column for column, _ in compiled.literals)))
+    unknown = [
+        f"{column} = {value!r}"
+        for column, value in compiled.literals
+        if not profile[column].known([value])
+    ]
+    if unknown:
+        st.warning(f"No rows have {', '.join(unknown)}")
+    return text
+
+
+@_shared_cache
+def _filter_cache():
+    """
+    Process-wide cache of filtered row positions keyed by (fingerprint, filter spec).
+    """
+    return LRUCache(FILTER_CACHE_DEFAULT_MB * 1024 ** 2)
+
+
+def normalize_predicates(predicates):
+    """
+    Turn a list of predicates into a hashable key that does not depend on
+    the order of the predicates or of the selected values.
+    """
+    normalized = []
+    for column, op, argument in predicates:
+        if op == "isin":
+            argument = tuple(sorted(set(argument), key=repr))
+        elif op == "expr":
+            argument = normalize_expression(argument)
+        else:
+            argument = tuple(argument)
+        normalized.append((column, op, argument))
+    return tuple(sorted(normalized, key=repr))
+
+
+def _json_value(value):
+    """
+    Convert a filter value to JSON-compatible data.
+
+    Numpy scalars become the matching Python values. Dates, datetimes and
+    decimals become {"type": ..., "value": <string>} so that _from_json_value
+    restores the same type.
+
+    Raises:
+        ValueError: If the value has no JSON encoding
+    """
+    if isinstance(value, np.datetime64):
+        value = pd.Timestamp(value)
+    elif isinstance(value, np.generic):
+        value = value.item()
+
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return value
+    if isinstance(value, pd.Timestamp):
+        return {"type": "timestamp", "value": value.isoformat()}
+    if isinstance(value, datetime):
+        return {"type": "datetime", "value": value.isoformat()}
+    if isinstance(value, date):
+        return {"type": "date", "value": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {"type": "decimal", "value": str(value)}
+    raise ValueError(f"Cannot encode filter value {value!r} of type {type(value).__name__}")
+
+
+def _from_json_value(value):
+    """
+    Restore a filter value encoded by _json_value.
+    """
+    if not isinstance(value, dict):
+        return value
+    decoders = {
+        "timestamp": pd.Timestamp,
+        "datetime": datetime.fromisoformat,
+        "date": date.fromisoformat,
+        "decimal": Decimal,
+    }
+    return decoders[value["type"]](value["value"])
+
+
+@dataclass(frozen=True)
+class FilterSpec:
+    """
+    A serializable set of filter predicates, independent of any widget.
+
+    Predicates are kept in normalized form (see normalize_predicates), so two
+    specs selecting the same rows compare equal and hash alike.
+    """
+    predicates: tuple = ()
+
+    @classmethod
+    def from_predicates(cls, predicates):
+        """
+        Build a spec from (column, op, argument) predicates in any order.
+        """
+        return cls(normalize_predicates(predicates))
+
+    def __bool__(self):
+        return bool(self.predicates)
+
+    def to_dict(self):
+        """
+        Return the spec as JSON-compatible data; datetime bounds become ISO
+        strings and other values are encoded by _json_value.
+
+        Raises:
+            ValueError: If a value has no JSON encoding
+        """
+        encoded = []
+        for column, op, argument in self.predicates:
+            if op == "isin":
+                encoded.append({"column": column, "op": op, "values": [_json_value(v) for v in argument]})
+            elif op == "between":
+                item = {"column": column, "op": op, "bounds": [_json_value(b) for b in argument]}
+                if any(isinstance(bound, pd.Timestamp) for bound in argument):
+                    item["bounds"] = [pd.Timestamp(bound).isoformat() for bound in argument]
+                    item["datetime"] = True
+                encoded.append(item)
+            elif op == "expr":
+                encoded.append({"op": op, "expr": argument})
+            else:
+                raise ValueError(f"Unknown filter operation: {op}")
+        return {"predicates": encoded}
+
+    @classmethod
+    def from_dict(cls, payload):
+        """
+        Rebuild a spec from the output of to_dict.
+        """
+        predicates = []
+        for item in payload.get("predicates", []):
+            op = item.get("op")
+            if op == "isin":
+                predicates.append((item["column"], op, [_from_json_value(v) for v in item["values"]]))
+            elif op == "between":
+                bounds = item["bounds"]
+                if item.get("datetime"):
+                    bounds = [pd.Timestamp(bound) for bound in bounds]
+                else:
+                    bounds = [_from_json_value(bound) for bound in bounds]
+                predicates.append((item["column"], op, bounds))
+            elif op == "expr":
+                predicates.append((None, op, item["expr"]))
+            else:
+                raise ValueError(f"Unknown filter operation: {op}")
+        return cls.from_predicates(predicates)
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, text):
+        return cls.from_dict(json.loads(text))
+
+
+def select_rows(data, fingerprint, predicates, use_indexes=False):
+    """
+    Compute the positions of the rows matching every predicate.
+
+    Args:
+        data (pandas.DataFrame): The unfiltered dataframe
+        fingerprint (str): Fingerprint of the dataset, required for indexes
+        predicates (list): Predicates as accepted by predicate_mask
+        use_indexes (bool): Answer predicates from cached column indexes
+
     Returns:
-        pandas.DataFrame: The loaded data or None if no file is uploaded.
+        numpy.ndarray: Sorted row positions
     """
-    st.sidebar.header("Upload Data")
+    if use_indexes and fingerprint is not None:
+        return intersect_rows(data, fingerprint, predicates)
+    return _row_positions(np.flatnonzero(combine_masks(data, predicates)))
 
-    uploaded_file = st.sidebar.file_uploader(
-        "Choose a CSV file",
-        type="csv",
-        help="Upload your auto dealership data in CSV format"
+
+def take_rows(data, positions):
+    """
+    Materialize the selected rows without touching the source frame.
+
+    The source is returned as is when there is no selection or every row is
+    selected; otherwise only the selected rows are copied.
+    """
+    if positions is None or len(positions) == len(data):
+        return data
+    return data.take(positions)
+
+
+def filter_rows(data, spec, fingerprint=None, use_indexes=False, cache=None):
+    """
+    Compute the positions of the rows selected by a filter spec.
+
+    Args:
+        data (pandas.DataFrame): The unfiltered dataframe
+        spec (FilterSpec): The filters to apply
+        fingerprint (str): Fingerprint of the dataset, required for indexes
+            and result caching
+        use_indexes (bool): Answer predicates from cached column indexes
+        cache (LRUCache): Optional cache of row positions by (fingerprint, spec)
+
+    Returns:
+        numpy.ndarray: Sorted row positions, or None when nothing is filtered
+    """
+    if not spec:
+        return None
+
+    cache_key = (fingerprint, spec.predicates)
+    positions = cache.get(cache_key) if cache is not None and fingerprint is not None else None
+    if positions is None:
+        positions = select_rows(data, fingerprint, spec.predicates, use_indexes)
+        if cache is not None and fingerprint is not None:
+            cache.put(cache_key, positions, positions.nbytes)
+    return positions
+
+
+def apply_filters(data, spec, fingerprint=None, use_indexes=False, cache=None):
+    """
+    Apply a filter spec to a dataframe without rendering anything.
+
+    Args:
+        data (pandas.DataFrame): The unfiltered dataframe
+        spec (FilterSpec): The filters to apply
+        fingerprint (str): Fingerprint of the dataset, required for indexes
+            and result caching
+        use_indexes (bool): Answer predicates from cached column indexes
+        cache (LRUCache): Optional cache of row positions by (fingerprint, spec)
+
+    Returns:
+        pandas.DataFrame: The filtered dataframe. This is data itself when
+            no filter removes any row, so callers must not modify it.
+    """
+    return take_rows(data, filter_rows(data, spec, fingerprint, use_indexes, cache))
+
+
+def _resize_filter_cache():
+    """
+    Apply an edited memory budget to the shared filter cache.
+    """
+    _filter_cache().resize(st.session_state["filter_cache_budget"] * 1024 ** 2)
+
+
+def _filter_cache_settings():
+    """
+    Render the filter cache budget control in the sidebar.
+
+    The budget is shared by all sessions, so the control always shows the
+    cache's current budget and only resizes it when the user edits it.
+
+    Returns:
+        tuple: (filter result cache, sidebar expander to report its
+            statistics in)
+    """
+    cache = _filter_cache()
+    st.session_state["filter_cache_budget"] = cache.max_bytes // 1024 ** 2
+    panel = st.sidebar.expander("Filter cache")
+    with panel:
+        st.number_input(
+            "Memory budget (MB)",
+            min_value=0,
+            step=64,
+            key="filter_cache_budget",
+            on_change=_resize_filter_cache,
+            help="Memory kept for recently used filter results, shared by all sessions"
+        )
+    return cache, panel
+
+
+def _show_filter_cache_stats(cache, panel):
+    """
+    Report the filter cache hit/miss counts and memory use.
+    """
+    panel.caption(
+        f"{cache.hits} hits, {cache.misses} misses, {len(cache)} results, "
+        f"{cache.current_bytes / 1024 ** 2:,.1f} of {cache.max_bytes / 1024 ** 2:,.0f} MB used"
     )
 
-    if uploaded_file is not None:
-        try:
-            data = pd.read_csv(uploaded_file)            
-            st.sidebar.success(f"Successfully loaded data with {data.shape[0]} rows and {data.shape[1]} columns")
-            return data
-        except Exception as e:
-            st.sidebar.error(f"Error loading data: {e}")
-            return None
+
+def _widget_key(column):
+    """
+    Return the session state key of a column's filter widget.
+    """
+    return f"filter_{column}"
+
+
+def _seeded_value(key, default, is_valid):
+    """
+    Return a keyed widget's value before it is drawn.
+
+    The default is written to the session state when the key is unset or its
+    value no longer fits the widget (for example after a new upload), so the
+    widget is drawn without a default and can also be seeded from a link.
+    """
+    if key not in st.session_state or not is_valid(st.session_state[key]):
+        st.session_state[key] = default
+    return st.session_state[key]
+
+
+def _keyed_selection(key, column_profile):
+    """
+    Return the current selection of a keyed multiselect before it is drawn.
+
+    Streamlit resets a widget whose options or labels change between reruns,
+    so the selection is written back to the session state, which takes
+    precedence over the reset. Values the column no longer holds (after a
+    new upload, or when sampling or cleaning changes the data) are dropped,
+    as Streamlit rejects a selection outside the options.
+    """
+    selected = column_profile.known(st.session_state.get(key, []))
+    st.session_state[key] = selected
+    return selected
+
+
+def _search_filter(column, column_profile, fingerprint, controls=st):
+    """
+    Render a type-ahead filter for a high-cardinality column.
+
+    A search box narrows the options to the values starting with the typed
+    prefix, so only a bounded number of options is ever sent to the browser.
+    The search box is drawn in controls, which is kept outside the filter
+    form in apply mode so that matches show as the prefix is typed.
+
+    Returns:
+        list: The selected values
+    """
+    key = _widget_key(column)
+    selected = _keyed_selection(key, column_profile)
+
+    query = controls.text_input(
+        f"Search {column}",
+        key=f"search_{column}",
+        placeholder="Type the start of a value",
+        help=f"{column_profile.distinct_count:,} distinct values; showing those that start with the search text"
+    )
+    matches, total = get_prefix_index(column_profile, fingerprint).search(query)
+
+    chosen = set(selected)
+    options = selected + [value for value in matches if value not in chosen]
+    selected_values = st.multiselect(
+        f"Select {column}",
+        options=options,
+        key=key
+    )
+
+    if total > len(matches):
+        st.caption(f"{total:,} matches, showing the first {len(matches)}")
+    return selected_values
+
+
+def _date_range_filter(column, column_profile, controls=st):
+    """
+    Render a date range filter, with optional time-of-day bounds.
+
+    The selection is returned as inclusive datetime64-compatible bounds: the
+    start of the first day and the last nanosecond of the last day (or of the
+    chosen minute), so filtering never converts rows to Python dates. The
+    time-of-day switch is drawn in controls, which is kept outside the
+    filter form in apply mode so that the time inputs appear straight away.
+
+    Returns:
+        tuple: (start, end) Timestamps, or None if the range covers the whole column
+    """
+    # Bounds are compared in naive wall-clock time, like the column values
+    min_value = pd.Timestamp(column_profile.min).tz_localize(None)
+    max_value = pd.Timestamp(column_profile.max).tz_localize(None)
+    min_date = min_value.date()
+    max_date = max_value.date()
+
+    # date_input only draws a range picker when given a range default, so a
+    # restored view sets that default instead of the widget state
+    initial = st.session_state.get(f"date_range_{column}")
+    if initial is None or not all(min_date <= d <= max_date for d in initial):
+        initial = (min_date, max_date)
+    date_range = st.date_input(
+        f"Filter {column}",
+        value=initial,
+        min_value=min_date,
+        max_value=max_date
+    )
+    if len(date_range) != 2:
+        return None
+    start_date, end_date = date_range
+
+    start_time, end_time = dt_time.min, None
+    if controls.checkbox(f"Time of day for {column}", key=f"time_{column}"):
+        time_cols = st.columns(2)
+        _seeded_value(f"start_time_{column}", dt_time(0, 0), lambda value: value is not None)
+        _seeded_value(f"end_time_{column}", dt_time(23, 59), lambda value: value is not None)
+        start_time = time_cols[0].time_input(f"Start time ({column})", step=60, key=f"start_time_{column}")
+        end_time = time_cols[1].time_input(f"End time ({column})", step=60, key=f"end_time_{column}")
+
+    start = pd.Timestamp.combine(start_date, start_time)
+    if end_time is None:
+        end = pd.Timestamp(end_date) + pd.Timedelta(days=1) - pd.Timedelta(1, "ns")
     else:
-        st.sidebar.info("Please upload a CSV file to begin analysis")
+        end = pd.Timestamp.combine(end_date, end_time) + pd.Timedelta(minutes=1) - pd.Timedelta(1, "ns")
+
+    if start <= min_value and end >= max_value:
         return None
+    return start, end
+
+
+def encode_filter_param(spec, fingerprint):
+    """
+    Encode a filter spec for the URL as "<fingerprint prefix>.<base64url>".
+
+    The spec's compact JSON is deflated before encoding, so long value lists
+    still make a shareable link.
+
+    Returns:
+        str: The query parameter value, or None when there is nothing to store
+    """
+    if not spec or fingerprint is None:
+        return None
+    payload = base64.urlsafe_b64encode(zlib.compress(spec.to_json().encode("utf-8"), 9))
+    return f"{fingerprint[:FILTER_PARAM_FINGERPRINT_CHARS]}.{payload.decode('ascii').rstrip('=')}"
+
+
+def decode_filter_param(value, fingerprint):
+    """
+    Decode a filter spec produced by encode_filter_param.
+
+    Raises:
+        ValueError: If the value is malformed or was made for another dataset
+    """
+    prefix, _, payload = value.partition(".")
+    if prefix != fingerprint[:FILTER_PARAM_FINGERPRINT_CHARS]:
+        raise ValueError("the link was made for a different dataset")
+    try:
+        text = zlib.decompress(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+        return FilterSpec.from_dict(json.loads(text))
+    except (ValueError, KeyError, TypeError, AttributeError, ArithmeticError, zlib.error) as e:
+        raise ValueError(f"the link's filters could not be read ({e})") from e
+
+
+def _restore_filters(data, fingerprint):
+    """
+    Seed the filter widgets from the spec in the URL, once per session and dataset.
+
+    Widgets are restored to exactly the state that produced the spec, so the
+    rebuilt spec matches the original and its rows come straight from the
+    filter cache.
+    """
+    flag = f"filters_restored_{fingerprint}"
+    if fingerprint is None or st.session_state.get(flag):
+        return
+    # Only the first run counts: later runs find the spec this session wrote
+    st.session_state[flag] = True
+    value = st.query_params.get(FILTER_QUERY_PARAM)
+    if not value:
+        return
+
+    try:
+        spec = decode_filter_param(value, fingerprint)
+    except ValueError as e:
+        st.warning(f"Shared filters ignored: {e}")
+        return
+
+    columns = [column for column, _, _ in spec.predicates if column in data.columns]
+    picker = f"filter_columns_{fingerprint}"
+    picked = set(st.session_state.get(picker, default_filter_columns(data))) | set(columns)
+    st.session_state[picker] = [column for column in data.columns if column in picked]
+
+    profile = get_profile(data, fingerprint, columns)
+    for column, op, argument in spec.predicates:
+        if op == "expr":
+            st.session_state["filter_expression"] = argument
+        elif column not in profile:
+            continue
+        elif op == "isin":
+            st.session_state[_widget_key(column)] = list(argument)
+        elif profile[column].kind == "datetime":
+            # Invert _date_range_filter: a whole-day end bound is the last
+            # nanosecond before midnight, a timed one the last of its minute
+            start, end = (pd.Timestamp(bound) for bound in argument)
+            after_end = end + pd.Timedelta(1, "ns")
+            if start.time() == dt_time.min and after_end.time() == dt_time.min:
+                st.session_state[f"date_range_{column}"] = (start.date(), (after_end - pd.Timedelta(days=1)).date())
+            else:
+                end = after_end - pd.Timedelta(minutes=1)
+                st.session_state[f"date_range_{column}"] = (start.date(), end.date())
+                st.session_state[f"time_{column}"] = True
+                st.session_state[f"start_time_{column}"] = start.time()
+                st.session_state[f"end_time_{column}"] = end.time()
+        else:
+            st.session_state[_widget_key(column)] = tuple(argument)
+
+
+def _share_filters(spec, fingerprint):
+    """
+    Keep the URL in sync with the applied filters.
+    """
+    if fingerprint is None:
+        return
+    try:
+        value = encode_filter_param(spec, fingerprint)
+    except ValueError:
+        # Some selected value has no URL encoding; the view cannot be linked
+        value = None
+    if value is None:
+        if FILTER_QUERY_PARAM in st.query_params:
+            del st.query_params[FILTER_QUERY_PARAM]
+    elif st.query_params.get(FILTER_QUERY_PARAM) != value:
+        st.query_params[FILTER_QUERY_PARAM] = value
+
+
+def _predicate_bitmap(data, fingerprint, predicate, use_indexes=False):
+    """
+    Return the boolean mask of one predicate, from its column index if enabled.
+    """
+    if use_indexes and fingerprint is not None and predicate[1] != "expr":
+        bitmap = np.zeros(len(data), dtype=bool)
+        bitmap[predicate_rows(data, fingerprint, predicate)] = True
+        return bitmap
+    return predicate_mask(data, predicate)
 
-def file_explorer(data):
+
+def _facet_codes(data, fingerprint, column_profile):
+    """
+    Return the column's values encoded as positions in its profile's sorted
+    distinct values (-1 for missing), cached per dataset and column.
+    """
+    key = (fingerprint, column_profile.name, "FacetCodes")
+    cache = _index_cache()
+    codes = cache.get(key) if fingerprint is not None else None
+    if codes is None:
+        codes = pd.Categorical(data[column_profile.name], categories=column_profile.values).codes
+        if fingerprint is not None:
+            cache.put(key, codes, codes.nbytes)
+    return codes
+
+
+def facet_counts(data, fingerprint, profile, predicates, columns, use_indexes=False):
+    """
+    Count, for every value of each column, the rows it would leave under the
+    other active filters.
+
+    Each predicate mask is evaluated once. A per-row count of failed
+    predicates then gives every column's "all other filters" selection
+    without re-evaluating anything: rows failing nothing, plus rows failing
+    only that column's own predicate. Counts are a bincount over the
+    column's value codes.
+
+    Args:
+        data (pandas.DataFrame): The unfiltered dataframe
+        fingerprint (str): Fingerprint of the dataset
+        profile (dict): Column profiles, as returned by get_profile
+        predicates (list): The active predicates
+        columns (list): Categorical columns to count
+        use_indexes (bool): Answer predicates from cached column indexes
+
+    Returns:
+        dict: Column name to a {value: row count} mapping
+    """
+    failures = None
+    own = {}
+    if predicates:
+        failures = np.zeros(len(data), dtype=np.uint8 if len(predicates) < 255 else np.uint16)
+        for predicate in predicates:
+            passed = _predicate_bitmap(data, fingerprint, predicate, use_indexes)
+            failures += ~passed
+            if predicate[0] in columns:
+                own[predicate[0]] = passed
+        passes_all = failures == 0
+
+    counts = {}
+    for column in columns:
+        values = profile[column].values
+        codes = _facet_codes(data, fingerprint, profile[column])
+        if failures is not None:
+            if column in own:
+                rows = passes_all | ((failures == 1) & ~own[column])
+            else:
+                rows = passes_all
+            codes = codes[rows]
+        column_counts = np.bincount(codes[codes >= 0], minlength=len(values))
+        counts[column] = dict(zip(values.tolist(), column_counts.tolist()))
+    return counts
+
+
+def _explorer_columns(data, fingerprint):
+    """
+    Render the chooser of columns shown in the explorer.
+
+    The choice is kept per session and dataset, starting from the first
+    EXPLORER_DEFAULT_COLUMNS columns.
+
+    Returns:
+        list: The chosen column names, in the order they were picked
+    """
+    key = f"explorer_columns_{fingerprint}"
+    if key not in st.session_state:
+        st.session_state[key] = list(data.columns[:EXPLORER_DEFAULT_COLUMNS])
+    return st.multiselect(
+        "Columns to show",
+        options=list(data.columns),
+        key=key,
+        help="Only these columns are sent to the browser"
+    )
+
+
+def _encode_page(page_data):
+    """
+    Encode a page as an Arrow table once, so st.dataframe can send it as is.
+
+    A slice of a categorical column keeps every category of the dataset,
+    and Arrow would send them all as the column's dictionary, so categories
+    unused on the page are dropped first. Pages holding values Arrow cannot
+    type (such as mixed object columns) are returned for Streamlit's own
+    conversion.
+    """
+    categorical = [i for i, dtype in enumerate(page_data.dtypes) if isinstance(dtype, pd.CategoricalDtype)]
+    if categorical:
+        page_data = page_data.copy(deep=False)
+        for i in categorical:
+            page_data.isetitem(i, page_data.iloc[:, i].cat.remove_unused_categories())
+    try:
+        return pa.Table.from_pandas(page_data, preserve_index=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        return page_data
+
+
+def file_explorer(data, fingerprint=None, spec=None):
     """
-    Display the raw data table with options to sort and filter.
+    Display the raw data table one page at a time, optionally sorted.
+
+    Only the rows of the current page are gathered and serialized, so the
+    payload sent to the browser is bounded by the page size rather than by
+    the size of the dataset. Sorting uses the column's cached sort
+    permutation restricted to the filtered rows; that ordering is memoized
+    per filter, so paging through it only gathers one page. The page is
+    projected to the chosen columns in the same gather and Arrow-encoded
+    once.
 
     Args:
-        data (pandas.DataFrame): The dataframe to display
+        data (pandas.DataFrame): The unfiltered dataframe
+        fingerprint (str): Fingerprint of the dataset, used to cache orderings
+        spec (FilterSpec): The filters whose rows are shown, or None for all rows
     """
     if data is not None:
         st.header("Data Explorer")
 
         with st.expander("Show Raw Data", expanded=False):
-            # Display dataframe with column configuration
+            cache = _filter_cache()
+            spec = spec or FilterSpec()
+            positions = filter_rows(data, spec, fingerprint, cache=cache)
+
+            columns = _explorer_columns(data, fingerprint)
+            if not columns:
+                st.caption("Choose at least one column to show.")
+                return
+
+            sorting = st.columns([3, 1])
+            # A remembered sort column may be missing from a new upload
+            _seeded_value("explorer_sort", None, lambda column: column is None or column in data.columns)
+            sort_column = sorting[0].selectbox(
+                "Sort by",
+                [None] + list(data.columns),
+                format_func=lambda column: "Original order" if column is None else column,
+                key="explorer_sort"
+            )
+            descending = sorting[1].checkbox("Descending", key="explorer_descending")
+
+            rows = positions
+            if sort_column is not None:
+                sort_key = (fingerprint, spec.predicates, "sorted", sort_column, descending)
+                rows = cache.get(sort_key) if fingerprint is not None else None
+                if rows is None:
+                    rows = sorted_rows(data, fingerprint, sort_column, descending, positions)
+                    if fingerprint is not None:
+                        cache.put(sort_key, rows, rows.nbytes)
+
+            total = len(data) if rows is None else len(rows)
+            nav = st.columns([1, 1, 2])
+            page_size = nav[0].selectbox(
+                "Rows per page",
+                EXPLORER_PAGE_SIZES,
+                index=EXPLORER_PAGE_SIZES.index(EXPLORER_DEFAULT_PAGE_SIZE),
+                key="explorer_page_size"
+            )
+            page_count = max(1, -(-total // page_size))
+            # Go back to the first page whenever the filters change the row count
+            if st.session_state.get("explorer_total") != total:
+                st.session_state["explorer_total"] = total
+                st.session_state["explorer_page"] = 1
+            _seeded_value("explorer_page", 1, lambda page: 1 <= page <= page_count)
+            page = nav[1].number_input(
+                "Page",
+                min_value=1,
+                max_value=page_count,
+                step=1,
+                key="explorer_page"
+            )
+
+            start = (page - 1) * page_size
+            end = min(start + page_size, total)
+            nav[2].caption(f"Page {page:,} of {page_count:,}: rows {min(start + 1, total):,}–{end:,} of {total:,}")
+
+            # Display only the current page of the chosen columns
+            page_rows = np.arange(start, end) if rows is None else rows[start:end]
+            page_data = data.iloc[page_rows, data.columns.get_indexer(columns)]
             st.dataframe(
-                data,
+                _encode_page(page_data),
                 use_container_width=True,
                 height=400
             )
 
-def filter_values(data):
+def write_export(data, positions, path, fmt, chunk_rows=EXPORT_CHUNK_ROWS):
     """
-    Provide filtering capabilities for the dataframe.
+    Write the selected rows to a file, one chunk of rows at a time.
+
+    Only one chunk is ever copied out of the source frame, so memory use is
+    bounded by the chunk size rather than by the size of the selection.
+    Parquet output gets one row group per chunk.
 
     Args:
-        data (pandas.DataFrame): The dataframe to filter
+        data (pandas.DataFrame): The unfiltered dataframe
+        positions (numpy.ndarray): Selected row positions, or None for all rows
+        path (str): File to write
+        fmt (str): One of the EXPORT_FORMATS keys
+        chunk_rows (int): Number of rows written per chunk
 
-    Returns:
-        pandas.DataFrame: The filtered dataframe
+    Yields:
+        int: The number of rows written so far, after each chunk
+    """
+    total = len(data) if positions is None else len(positions)
+    chunk_starts = range(0, total, chunk_rows) if total else [0]
+
+    def chunks():
+        for start in chunk_starts:
+            stop = min(start + chunk_rows, total)
+            if positions is None:
+                yield data.iloc[start:stop]
+            else:
+                yield data.take(positions[start:stop])
+
+    written = 0
+    if fmt == "Parquet":
+        writer = None
+        try:
+            for chunk in chunks():
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema)
+                writer.write_table(table)
+                written += len(chunk)
+                yield written
+        finally:
+            if writer is not None:
+                writer.close()
+        return
+
+    opener = gzip.open if fmt == "CSV (gzip)" else open
+    with opener(path, "wt", newline="", encoding="utf-8") as f:
+        for chunk in chunks():
+            chunk.to_csv(f, header=written == 0, index=False)
+            written += len(chunk)
+            yield written
+
+
+def _remove_export(path):
+    """
+    Delete an export file, ignoring one that another session already removed.
+
+    A download in progress keeps its open file and completes.
+    """
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _remove_stale_exports(max_age=EXPORT_STALE_SECONDS):
+    """
+    Delete export files older than max_age seconds, whichever session wrote them.
+
+    Args:
+        max_age (float): Age in seconds after which an export file is stale
+    """
+    if not os.path.isdir(EXPORT_DIR):
+        return
+    cutoff = time.time() - max_age
+    for name in os.listdir(EXPORT_DIR):
+        if not name.startswith(EXPORT_FILE_PREFIX):
+            continue
+        path = os.path.join(EXPORT_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            # Another session removed it first
+            pass
+
+
+def export_data(data, fingerprint=None, spec=None):
+    """
+    Offer the filtered rows for download as CSV, gzipped CSV or Parquet.
+
+    The export is only built when requested, and is streamed in chunks to a
+    file in the app's static folder. The download link points at Streamlit's
+    static file route, which streams the file from disk, so the export is
+    never held in server memory. The file is kept until the dataset, filters
+    or format change, and is named with a random token so that only this
+    session's link finds it.
+
+    Args:
+        data (pandas.DataFrame): The unfiltered dataframe
+        fingerprint (str): Fingerprint of the dataset
+        spec (FilterSpec): The filters whose rows are exported, or None for all rows
     """
     if data is None:
-        return None
+        return
 
-    st.header("Data Filtering")
+    spec = spec or FilterSpec()
+    with st.expander("Export Data", expanded=False):
+        if not st.get_option("server.enableStaticServing"):
+            st.caption("Exports are downloaded as static files; set server.enableStaticServing to true to enable them.")
+            return
+
+        fmt = st.radio("Format", list(EXPORT_FORMATS), horizontal=True, key="export_format")
+        suffix = EXPORT_FORMATS[fmt]
+        export_key = (fingerprint, spec.predicates, fmt)
+
+        previous = st.session_state.get("export_file")
+        if previous is not None and (previous[0] != export_key or not os.path.exists(previous[1])):
+            # The view changed, or the file went stale; drop it
+            _remove_export(previous[1])
+            del st.session_state["export_file"]
+            previous = None
+
+        if previous is None:
+            # Rows are only selected once requested; in sampling mode data is
+            # the full dataset, and reruns must not scan it
+            if not st.button("Prepare export", key="export_prepare"):
+                return
+            positions = filter_rows(data, spec, fingerprint, cache=_filter_cache())
+            total = len(data) if positions is None else len(positions)
+
+            _remove_stale_exports()
+            os.makedirs(EXPORT_DIR, exist_ok=True)
+            path = os.path.join(EXPORT_DIR, f"{EXPORT_FILE_PREFIX}{secrets.token_urlsafe(16)}{suffix}")
+            progress = st.progress(0.0, text="Writing export...")
+            too_large = False
+            writer = write_export(data, positions, path, fmt)
+            try:
+                for written in writer:
+                    if os.path.getsize(path) > EXPORT_MAX_BYTES:
+                        too_large = True
+                        break
+                    progress.progress(min(written / max(total, 1), 1.0), text=f"Writing export... {written:,} rows")
+            except Exception:
+                writer.close()
+                _remove_export(path)
+                raise
+            # Closing the writer closes its file, also when stopped early
+            writer.close()
+            progress.empty()
+
+            if too_large:
+                _remove_export(path)
+                st.error(
+                    f"The export is larger than {EXPORT_MAX_BYTES / 1024 ** 2:,.0f} MB, the most Streamlit "
+                    "serves as a static file. Narrow the filters or choose a compressed format."
+                )
+                return
+            st.session_state["export_file"] = (export_key, path, total)
+            previous = st.session_state["export_file"]
+
+        _, path, total = previous
+        st.caption(f"{total:,} rows, {os.path.getsize(path) / 1024 ** 2:,.1f} MB ready.")
+        # The download attribute saves the file under a readable name; the
+        # static route sends it as plain text, which a plain link would display
+        st.markdown(
+            f'<a href="{EXPORT_URL}/{os.path.basename(path)}" download="filtered_data{suffix}">Download</a>',
+            unsafe_allow_html=True
+        )
+
+
+def _show_pending_filters(spec, submitted):
+    """
+    Report which filters the results reflect while the panel is in apply mode.
+
+    Form widgets keep edits in the browser until submission, so the script
+    cannot tell whether any edit is pending; the caption only states what
+    was last applied.
+    """
+    count = f"{len(spec.predicates)} filter{'s' if len(spec.predicates) != 1 else ''}"
+    if submitted:
+        st.caption(f"Applied {count}.")
+    else:
+        st.caption(f"Showing {count} as last applied. Changes in the form take effect when you press Apply filters.")
+
+
+def filter_panel(data, fingerprint, cache):
+    """
+    Render the filter widgets and turn their state into a filter spec.
+
+    Widgets are only built for the columns picked in the panel, from their
+    cached column profiles, so neither the first paint nor later reruns scan
+    columns nobody filters on. Each active widget adds a predicate; untouched
+    ranges add none. Multiselect options show how many rows each value would
+    leave under the other filters.
+
+    Args:
+        data (pandas.DataFrame): The dataframe to filter
+        fingerprint (str): Fingerprint of the dataset, used to cache its profile
+        cache (LRUCache): Cache for the facet counts
 
-    filtered_data = data.copy()
+    Returns:
+        tuple: (FilterSpec, whether to answer it from column indexes)
+    """
+    predicates = []
 
     with st.expander("Filter Data", expanded=True):
-        # Create columns for filter layout
-        cols = st.columns(3)
-
-        # Process each column in the dataframe
-        filter_count = 0
-        for i, column in enumerate(data.columns):
-            # Determine column type
-            is_numeric = pd.api.types.is_numeric_dtype(data[column])
-            is_datetime = pd.api.types.is_datetime64_dtype(data[column])
-            is_categorical = (not is_numeric and not is_datetime) or (is_numeric and data[column].nunique() < 20)
-
-            # Place in appropriate column (cycling through the 3 columns)
-            with cols[filter_count % 3]:
-                if is_categorical:
-                    # For categorical data or numeric with few unique values
-                    # Handle mixed types by converting to strings before sorting
-                    unique_values = data[column].unique()
-                    try:
-                        unique_values = sorted(unique_values)
-                    except TypeError:
-                        # If sorting fails due to mixed types, convert to strings
-                        unique_values = sorted(unique_values.astype(str))
-
-                    selected_values = st.multiselect(
+        use_indexes = st.checkbox(
+            "Use column indexes",
+            value=len(data) >= INDEX_MIN_ROWS,
+            disabled=fingerprint is None,
+            help="Build sorted and inverted indexes once per dataset so filters avoid full column scans"
+        )
+
+        apply_mode = st.toggle(
+            "Apply filters on demand",
+            key="filter_apply_mode",
+            help="Batch widget changes and recompute only when Apply filters is pressed"
+        )
+
+        _restore_filters(data, fingerprint)
+        profile = get_profile(data, fingerprint, _column_picker(data, fingerprint))
+
+        # In apply mode the widgets live in a form, whose values only reach
+        # the script (and trigger a rerun) when it is submitted. Search boxes
+        # and time-of-day switches only change which widgets are drawn, so
+        # they stay above the form and act immediately.
+        controls = st.container() if apply_mode else st
+        panel = st.form("filter_form", border=False) if apply_mode else st.container()
+        with panel:
+            expression = _expression_filter(data, fingerprint)
+            if expression is not None:
+                predicates.append((None, "expr", expression))
+
+            # Create columns for filter layout, with one cell per filterable column
+            # (cycling through the 3 columns) so cells can be filled in any order
+            cols = st.columns(3)
+            filterable = [
+                column for column, column_profile in profile.items()
+                if column_profile.kind == "categorical" or column_profile.min is not None
+            ]
+            cells = {column: cols[i % 3].container() for i, column in enumerate(filterable)}
+
+            # Process each column in the dataframe; multiselects are drawn last,
+            # once the facet counts under all other filters are known
+            facet_columns = []
+            for column in filterable:
+                column_profile = profile[column]
+                with cells[column]:
+                    if column_profile.kind == "categorical" and column_profile.distinct_count > HIGH_CARDINALITY_THRESHOLD:
+                        # For identifiers and other columns with too many values to list
+                        selected_values = _search_filter(column, column_profile, fingerprint, controls)
+
+                        if selected_values:
+                            predicates.append((column, "isin", selected_values))
+
+                    elif column_profile.kind == "categorical":
+                        # For categorical data or numeric with few unique values
+                        selected_values = _keyed_selection(_widget_key(column), column_profile)
+                        facet_columns.append(column)
+
+                        if selected_values:
+                            predicates.append((column, "isin", selected_values))
+
+                    elif column_profile.kind == "datetime":
+                        # For datetime columns
+                        bounds = _date_range_filter(column, column_profile, controls)
+
+                        if bounds is not None:
+                            predicates.append((column, "between", bounds))
+
+                    else:
+                        # For continuous numeric data
+                        min_val = float(column_profile.min)
+                        max_val = float(column_profile.max)
+
+                        _seeded_value(
+                            _widget_key(column),
+                            (min_val, max_val),
+                            lambda bounds: min_val <= bounds[0] <= bounds[1] <= max_val
+                        )
+                        value_range = st.slider(
+                            f"Filter {column}",
+                            min_value=min_val,
+                            max_value=max_val,
+                            step=(max_val - min_val) / 100,
+                            key=_widget_key(column)
+                        )
+
+                        if tuple(value_range) != (min_val, max_val):
+                            predicates.append((column, "between", tuple(value_range)))
+
+            facets_key = (fingerprint, normalize_predicates(predicates), "facets", tuple(facet_columns))
+            facets = cache.get(facets_key) if fingerprint is not None else None
+            if facets is None:
+                facets = facet_counts(data, fingerprint, profile, predicates, facet_columns, use_indexes)
+                if fingerprint is not None:
+                    cache.put(facets_key, facets, 64 * sum(len(counts) for counts in facets.values()))
+
+            for column in facet_columns:
+                counts = facets[column]
+                with cells[column]:
+                    st.multiselect(
                         f"Select {column}",
-                        options=unique_values,
-                        default=[]
+                        options=profile[column].values,
+                        key=_widget_key(column),
+                        format_func=lambda value, counts=counts: f"{value} ({counts.get(value, 0):,})"
                     )
 
-                    if selected_values:
-                        filtered_data = filtered_data[filtered_data[column].isin(selected_values)]
+            if apply_mode:
+                submitted = st.form_submit_button("Apply filters", type="primary")
+                _show_pending_filters(FilterSpec.from_predicates(predicates), submitted)
 
-                elif is_datetime:
-                    # For datetime columns
-                    min_date = data[column].min().date()
-                    max_date = data[column].max().date()
+    return FilterSpec.from_predicates(predicates), use_indexes
 
-                    date_range = st.date_input(
-                        f"Filter {column}",
-                        value=(min_date, max_date),
-                        min_value=min_date,
-                        max_value=max_date
-                    )
 
-                    if len(date_range) == 2:
-                        start_date, end_date = date_range
-                        filtered_data = filtered_data[
-                            (filtered_data[column].dt.date >= start_date) & 
-                            (filtered_data[column].dt.date <= end_date)
-                        ]
+def filter_values(data, fingerprint=None):
+    """
+    Provide filtering capabilities for the dataframe.
 
-                else:
-                    # For continuous numeric data
-                    min_val = float(data[column].min())
-                    max_val = float(data[column].max())
-
-                    value_range = st.slider(
-                        f"Filter {column}",
-                        min_value=min_val,
-                        max_value=max_val,
-                        value=(min_val, max_val),
-                        step=(max_val - min_val) / 100
-                    )
+    The panel only produces a FilterSpec, which filter_rows evaluates as
+    masks over the original columns, or from per-column indexes on large
+    datasets. Results are memoized as row positions by dataset fingerprint
+    and spec; no rows are copied here, as the explorer and export gather
+    only the rows they need. The spec is mirrored in the URL, so a reloaded
+    or shared link restores the same view from the cache.
+
+    Args:
+        data (pandas.DataFrame): The dataframe to filter
+        fingerprint (str): Fingerprint of the dataset, used to cache its profile
+
+    Returns:
+        FilterSpec: The active filters, also kept in the session state
+    """
+    if data is None:
+        return None
+
+    st.header("Data Filtering")
 
-                    filtered_data = filtered_data[
-                        (filtered_data[column] >= value_range[0]) & 
-                        (filtered_data[column] <= value_range[1])
-                    ]
+    cache, cache_panel = _filter_cache_settings()
+    spec, use_indexes = filter_panel(data, fingerprint, cache)
+    st.session_state["filter_spec"] = spec
+    _share_filters(spec, fingerprint)
 
-                filter_count += 1
+    positions = filter_rows(data, spec, fingerprint, use_indexes, cache)
+    _show_filter_cache_stats(cache, cache_panel)
 
     # Show filtering stats
-    if len(filtered_data) < len(data):
-        st.info(f"Filtered data: {len(filtered_data)} rows (from {len(data)} total)")
+    if positions is not None and len(positions) < len(data):
+        st.info(f"Filtered data: {len(positions)} rows (from {len(data)} total)")
 
-    return filtered_data
+    return spec
 
 def main():
     """
@@ -167,11 +2974,26 @@ def main():
         data = load_data()
 
         if data is not None:
+            fingerprint = st.session_state.get("dataset_fingerprint")
+
+            # Optionally drop nulls and blanks and impute outliers
+            data, fingerprint = data_cleaning(data, fingerprint)
+
+            # Explore a sample of very large datasets
+            view, view_fingerprint = sample_data(data, fingerprint)
+
             # Filter data
-            filtered_data = filter_values(data)
+            filter_values(view, view_fingerprint)
+            spec = st.session_state.get("filter_spec")
+
+            # Display data explorer, paging through the filtered rows by position
+            file_explorer(view, view_fingerprint, spec)
+
+            if view is not data:
+                exact_aggregates(data, fingerprint, spec)
 
-            # Display data explorer
-            file_explorer(filtered_data)
+            # Offer the filtered rows of the full data for download
+            export_data(data, fingerprint, spec)
 
     except Exception as e:
         st.error(f"An error occurred: {e}")
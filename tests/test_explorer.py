@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+import dashboard
+
+
+def _encoded_page(category_count, rows=100):
+    """
+    Encode the first page of a frame whose categorical column has category_count categories.
+    """
+    categories = [f"value-{i:07d}" for i in range(category_count)]
+    data = pd.DataFrame({
+        "Label": pd.Categorical.from_codes(np.arange(rows * 10) % rows, categories),
+        "Value": np.arange(rows * 10, dtype=np.float64),
+    })
+    return dashboard._encode_page(data.iloc[:rows])
+
+
+def _ipc_bytes(table):
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().size
+
+
+def test_page_bytes_do_not_depend_on_category_count():
+    small = _encoded_page(100)
+    large = _encoded_page(500_000)
+    assert _ipc_bytes(large) == _ipc_bytes(small)
+    assert large.column("Label").to_pylist() == small.column("Label").to_pylist()
+
+
+def test_mixed_types_sort_by_string_form():
+    series = pd.Series(["b", 3, None, "a", 10], dtype=object)
+    order = dashboard.SortOrder(series)
+    assert series.take(order.rows()).tolist()[:4] == [10, 3, "a", "b"]
+    assert series.take(order.rows(descending=True)).tolist()[:4] == ["b", "a", 3, 10]
+    assert pd.isna(series[order.rows()[-1]])
+
+
+def test_mixed_categories_sort_by_string_form():
+    series = pd.Series(pd.Categorical(["b", 3, None, "a"]))
+    assert series.take(dashboard.SortOrder(series).rows()).tolist()[:3] == [3, "a", "b"]
@@ -0,0 +1,144 @@
+import datetime
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import dashboard
+from dashboard import FilterSpec, filter_rows, select_rows
+
+
+ROWS = 5_000
+FINGERPRINT = "test-filtering"
+
+
+@pytest.fixture(scope="module")
+def data():
+    rng = np.random.default_rng(0)
+    makes = rng.choice(["BMW", "Ford", "Honda", "Toyota"], ROWS).astype(object)
+    makes[rng.random(ROWS) < 0.05] = None
+    prices = rng.normal(30_000, 8_000, ROWS).round(2)
+    prices[rng.random(ROWS) < 0.05] = np.nan
+    dates = pd.Series(pd.to_datetime("2020-01-01") + pd.to_timedelta(rng.integers(0, 365 * 24, ROWS), unit="h"))
+    dates[rng.random(ROWS) < 0.05] = pd.NaT
+    return pd.DataFrame({
+        "Make": pd.Categorical(makes),
+        "Year": rng.integers(2010, 2024, ROWS),
+        "Price": prices,
+        "MSRP": prices * 1.1,
+        "Date": dates,
+    })
+
+
+PREDICATES = [
+    [("Make", "isin", ["BMW", "Honda"])],
+    [("Year", "isin", [2012, 2015, 2023])],
+    [("Price", "between", (20_000.5, 40_000.0))],
+    [("Date", "between", (pd.Timestamp("2020-03-01"), pd.Timestamp("2020-06-01 12:00")))],
+    [(None, "expr", "MSRP > 30000 and Make == 'Ford'")],
+    [
+        ("Make", "isin", ["Toyota"]),
+        ("Year", "isin", [2010, 2011, 2012, 2013]),
+        ("Price", "between", (25_000, 35_000)),
+        ("Date", "between", (pd.Timestamp("2020-02-01"), pd.Timestamp("2020-11-30"))),
+    ],
+    [("Make", "isin", ["Unknown"])],
+]
+
+
+@pytest.mark.parametrize("predicates", PREDICATES)
+def test_index_matches_mask(data, predicates):
+    spec = FilterSpec.from_predicates(predicates)
+    by_mask = select_rows(data, FINGERPRINT, spec.predicates)
+    by_index = select_rows(data, FINGERPRINT, spec.predicates, use_indexes=True)
+    np.testing.assert_array_equal(by_mask, by_index)
+
+
+def test_mask_matches_pandas(data):
+    spec = FilterSpec.from_predicates([
+        ("Make", "isin", ["BMW", "Honda"]),
+        ("Price", "between", (20_000.5, 40_000.0)),
+        ("Date", "between", (pd.Timestamp("2020-03-01"), pd.Timestamp("2020-06-01 12:00"))),
+    ])
+    expected = np.flatnonzero(
+        data["Make"].isin(["BMW", "Honda"])
+        & data["Price"].between(20_000.5, 40_000.0)
+        & data["Date"].between(pd.Timestamp("2020-03-01"), pd.Timestamp("2020-06-01 12:00"))
+    )
+    np.testing.assert_array_equal(filter_rows(data, spec), expected)
+
+
+def test_empty_spec_selects_everything(data):
+    assert filter_rows(data, FilterSpec()) is None
+    assert dashboard.apply_filters(data, FilterSpec()) is data
+
+
+def test_cached_positions_are_reused(data):
+    cache = dashboard.LRUCache(1024 ** 2)
+    spec = FilterSpec.from_predicates(PREDICATES[0])
+    first = filter_rows(data, spec, FINGERPRINT, cache=cache)
+    assert filter_rows(data, spec, FINGERPRINT, cache=cache) is first
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_spec_ignores_predicate_and_value_order():
+    first = FilterSpec.from_predicates([("Make", "isin", ["BMW", "Ford"]), ("Year", "isin", [2020])])
+    second = FilterSpec.from_predicates([("Year", "isin", [2020]), ("Make", "isin", ["Ford", "BMW"])])
+    assert first == second
+    assert hash(first) == hash(second)
+
+
+@pytest.mark.parametrize("predicates", PREDICATES + [
+    [("Year", "isin", [np.int64(2015), np.int64(2020)]), ("Price", "between", (np.float64(1.5), np.float64(2.5)))],
+    [(None, "expr", "Make  ==  'Land  Rover'   or Price>1")],
+])
+def test_spec_json_round_trip(predicates):
+    spec = FilterSpec.from_predicates(predicates)
+    restored = FilterSpec.from_json(spec.to_json())
+    assert restored == spec
+    assert restored.to_json() == spec.to_json()
+
+
+def test_datetime_bounds_round_trip_as_timestamps():
+    bounds = (pd.Timestamp("2020-03-01"), pd.Timestamp("2020-06-01 12:00"))
+    spec = FilterSpec.from_json(FilterSpec.from_predicates([("Date", "between", bounds)]).to_json())
+    (_, _, restored), = spec.predicates
+    assert all(isinstance(bound, pd.Timestamp) for bound in restored)
+    assert tuple(restored) == bounds
+
+
+@pytest.mark.parametrize("values", [
+    [datetime.date(2020, 1, 1), datetime.date(2021, 5, 3)],
+    [datetime.datetime(2020, 1, 1, 12, 30), datetime.datetime(2020, 1, 2)],
+    [pd.Timestamp("2020-01-01 00:00:00.000000001")],
+    [np.datetime64("2020-01-01T12:00")],
+    [Decimal("1.50"), Decimal("2.25")],
+])
+def test_typed_values_round_trip(values):
+    spec = FilterSpec.from_predicates([("Column", "isin", values)])
+    restored = FilterSpec.from_json(spec.to_json())
+    assert restored == spec
+    (_, _, restored_values), = restored.predicates
+    expected = [pd.Timestamp(value) if isinstance(value, np.datetime64) else value for value in values]
+    assert [type(value) for value in restored_values] == [type(value) for value in sorted(expected, key=repr)]
+
+
+def test_unencodable_value_is_rejected():
+    spec = FilterSpec.from_predicates([("Column", "isin", [datetime.time(12, 30)])])
+    with pytest.raises(ValueError):
+        spec.to_json()
+
+
+def test_filter_param_round_trip():
+    spec = FilterSpec.from_predicates(PREDICATES[5])
+    value = dashboard.encode_filter_param(spec, FINGERPRINT)
+    assert dashboard.decode_filter_param(value, FINGERPRINT) == spec
+    with pytest.raises(ValueError):
+        dashboard.decode_filter_param(value, "another-dataset")
+
+
+def test_caches_are_shared_outside_streamlit():
+    assert dashboard._filter_cache() is dashboard._filter_cache()
+    assert dashboard._index_cache() is dashboard._index_cache()
+    assert dashboard._expression_cache() is dashboard._expression_cache()